@@ -0,0 +1,61 @@
+"""
+Scaling benchmark of the ACPM (Prim) stage of christofides.py
+
+run from the root of the project:
+    python -m benchmarks.bench_acpm
+    python -m benchmarks.bench_acpm --sizes 100 1000 10000 --dtype float32
+"""
+import argparse
+import time
+
+import numpy as np
+
+from christofides import ACPM
+
+DEFAULT_SIZES = [100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+def random_metric(n, dtype, rng):
+    """symmetric random matrix with a zero diagonal, the metric closure is not needed to time Prim"""
+    m = rng.integers(1, 100, size=(n, n)).astype(dtype)
+    m = np.triu(m, 1)
+    return m + m.T
+
+
+def time_call(f, *args, repeat=1, **kwargs):
+    """best wall-clock time over 'repeat' calls and the result of the last call"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = f(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ACPM scaling benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--dtype", choices=["int32", "int64", "float32", "float64"], default="int32")
+    parser.add_argument("--loop-max", type=int, default=2000,
+                        help="largest n for which the python loop version is also timed")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'n':>7} {'vectorized (s)':>15} {'loop (s)':>10} {'speedup':>8} {'same':>5}")
+    for n in args.sizes:
+        graph = random_metric(n, args.dtype, rng)
+        t_vec, pred_vec = time_call(ACPM, graph, method="vectorized", repeat=args.repeat)
+
+        if n <= args.loop_max:
+            t_loop, pred_loop = time_call(ACPM, graph, method="loop", repeat=1)
+            same = bool(np.array_equal(pred_vec, pred_loop))
+            print(f"{n:>7} {t_vec:>15.4f} {t_loop:>10.4f} {t_loop / t_vec:>8.1f} {str(same):>5}")
+        else:
+            print(f"{n:>7} {t_vec:>15.4f} {'-':>10} {'-':>8} {'-':>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark of cnn_algorithm.compress: one Dijkstra per pair of U ("dijkstra")
+against one all-pairs shortest path on the visited vertices + min-plus products ("minplus")
+
+run from the root of the project:
+    python -m benchmarks.bench_compress
+    python -m benchmarks.bench_compress --unvisited 50 100 400 --n 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from cnn_algorithm import compress, KnownGraph
+
+DEFAULT_UNVISITED = [10, 25, 50, 100, 200, 400]
+
+
+def random_known_graph(n, nb_unvisited, rng, blocked_ratio=0.01):
+    """
+    random metric G* (int32) with some blocked edges and a random set U of
+    unvisited vertices that contains the start vertex 0
+    """
+    points = rng.uniform(0, 1000, size=(n, 2))
+    diff = points[:, None, :] - points[None, :, :]
+    matrix = np.rint(np.sqrt((diff ** 2).sum(axis=-1))).astype(np.int32) + 1
+    np.fill_diagonal(matrix, 0)
+
+    iu = np.triu_indices(n, 1)
+    blocked = rng.random(len(iu[0])) < blocked_ratio
+    G_star = KnownGraph(matrix, zip(iu[0][blocked].tolist(), iu[1][blocked].tolist()))
+
+    U = {0} | set(rng.choice(np.arange(1, n), size=nb_unvisited - 1, replace=False).tolist())
+    return G_star, U
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compress benchmark")
+    parser.add_argument("--unvisited", type=int, nargs="+", default=DEFAULT_UNVISITED,
+                        help="sizes of U")
+    parser.add_argument("--n", type=int, default=None,
+                        help="number of vertices, by default 4 * |U|")
+    parser.add_argument("--dijkstra-max", type=int, default=60,
+                        help="largest |U| for which the per-pair Dijkstra version is also timed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'|U|':>5} {'n':>6} {'minplus (s)':>12} {'dijkstra (s)':>13} {'speedup':>8} {'same':>5}"
+          f" {'paths (MB)':>11} {'per-pair (MB)':>14}")
+    for size in args.unvisited:
+        n = args.n if args.n is not None else 4 * size
+        G_star, U = random_known_graph(n, size, rng)
+
+        start = time.perf_counter()
+        G_fast, paths = compress(G_star, U)
+        t_fast = time.perf_counter() - start
+
+        # the dijkstra version keeps two int64 predecessor arrays of size n per pair of U
+        memory = f"{paths.nbytes / 2**20:>11.2f} {size * (size - 1) * n * 8 / 2**20:>14.2f}"
+
+        if size <= args.dijkstra_max:
+            start = time.perf_counter()
+            G_ref, _ = compress(G_star, U, method="dijkstra")
+            t_ref = time.perf_counter() - start
+            same = bool(np.array_equal(np.array(G_ref), G_fast))
+            print(f"{size:>5} {n:>6} {t_fast:>12.4f} {t_ref:>13.4f} {t_ref / t_fast:>8.1f} {str(same):>5} {memory}")
+        else:
+            print(f"{size:>5} {n:>6} {t_fast:>12.4f} {'-':>13} {'-':>8} {'-':>5} {memory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Startup cost of each module of the project: time of `import module` in a new python process
+(what a worker of a process pool pays when it is spawned), and the heavy dependencies
+(scipy, networkx) it loads. numpy is imported before the timer, every module needs it.
+
+Each import is repeated in --repeat new processes, the median and the minimum are printed.
+With --check the exit code is 1 if a module loads scipy or networkx at import time.
+
+run from the root of the project:
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --modules utils cnn_algorithm --repeat 10 --check
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["utils", "blockage_index", "instrumentation", "christofides", "tour_cache", "local_search",
+           "sparse_graph", "candidate_graph", "instance", "routage_cyclique", "cnn_algorithm", "online",
+           "scenarios", "corpus", "graphe_du_papier", "comparison"]
+HEAVY = ["scipy", "networkx"]
+
+# run in the new process: the time of the import and the heavy packages loaded by it
+PROBE = """
+import json, sys, time
+import numpy
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy!r}))
+print(json.dumps([elapsed, heavy]))
+"""
+
+
+def measure(module, repeat):
+    """times in seconds of `import module` in repeat new processes and the heavy packages it loads"""
+    times = []
+    heavy = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+                             cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        # the last line, a module that prints at import time would write before it
+        elapsed, heavy = json.loads(out.strip().splitlines()[-1])
+        times.append(elapsed)
+    return times, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import time benchmark")
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5, help="number of new processes for each module")
+    parser.add_argument("--check", action="store_true", help="exit code 1 if a module loads scipy or networkx")
+    args = parser.parse_args()
+
+    print(f"{'module':>18} {'median (ms)':>12} {'min (ms)':>9}  heavy dependencies")
+    failed = []
+    for module in args.modules:
+        times, heavy = measure(module, args.repeat)
+        print(f"{module:>18} {1000 * statistics.median(times):>12.1f} {1000 * min(times):>9.1f}  "
+              f"{', '.join(heavy) or '-'}")
+        if heavy:
+            failed.append(module)
+
+    if args.check and failed:
+        print(f"heavy dependencies loaded at import time by: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Quality and cost of the large-instance christofides (candidate_graph.christofides_knn) against the dense one
+(christofides.apply_christophides) on random points: tour length ratio, time and peak memory (tracemalloc).
+The dense solver is only run up to --dense-max (its matrix is n x n), the large one up to any n.
+
+run from the root of the project:
+    python -m benchmarks.bench_large_christofides
+    python -m benchmarks.bench_large_christofides --sizes 1000 5000 50000 --k 10 --matchings greedy blossom
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from candidate_graph import PointDistances, christofides_knn
+from christofides import apply_christophides
+from local_search import tour_cost
+
+DEFAULT_SIZES = [500, 1000, 2000, 5000, 50000]
+
+
+def measure(function, memory=True):
+    """result, time in seconds and peak memory in MB of function() (nan without memory)"""
+    if not memory:
+        start = time.perf_counter()
+        result = function()
+        return result, time.perf_counter() - start, float("nan")
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="large christofides benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--k", type=int, default=10, help="neighbours of each vertex in the candidate graph")
+    parser.add_argument("--matchings", nargs="+", choices=["greedy", "blossom"], default=["greedy"],
+                        help="matchings of the large christofides on the candidate edges")
+    parser.add_argument("--dense-max", type=int, default=5000, help="largest n for which the dense christofides is run")
+    parser.add_argument("--blossom-max", type=int, default=500,
+                        help="largest n for which the exact blossom is used (knn matching above), also for the large one")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip tracemalloc (it slows the networkx blossom a lot)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'n':>6} {'solver':>16} {'time (s)':>9} {'peak (MB)':>10} {'cost':>12} {'vs dense':>9}")
+    for n in args.sizes:
+        points = PointDistances(rng.uniform(0, 1000, size=(n, 2)))
+        reference = None
+        if n <= args.dense_max:
+            matching = "blossom" if n <= args.blossom_max else "knn"
+
+            def dense():
+                matrix = points.rows(np.arange(n))
+                return tour_cost(matrix, apply_christophides(matrix, matching=matching, k=args.k))
+
+            reference, elapsed, peak = measure(dense, not args.no_memory)
+            print(f"{n:>6} {'dense ' + matching:>16} {elapsed:>9.2f} {peak:>10.1f} {reference:>12.0f} {'-':>9}")
+
+        for matching in args.matchings:
+            if matching == "blossom" and n > args.blossom_max:
+                continue
+            tour, elapsed, peak = measure(lambda: christofides_knn(points, k=args.k, matching=matching),
+                                          not args.no_memory)
+            cost = tour_cost(points, tour)
+            ratio = f"{cost / reference:.3f}" if reference else "-"
+            print(f"{n:>6} {'knn ' + matching:>16} {elapsed:>9.2f} {peak:>10.1f} {cost:>12.0f} {ratio:>9}")
+
+
+if __name__ == "__main__":
+    main()
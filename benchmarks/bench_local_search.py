@@ -0,0 +1,94 @@
+"""
+Benchmark of the local search of the christofides tour (local_search.improve_tour)
+for each size and budget: the tour length before / after, the gain per millisecond
+and the cost of CR and CNN on the christofides tour and on the improved one
+
+run from the root of the project:
+    python -m benchmarks.bench_local_search
+    python -m benchmarks.bench_local_search --sizes 1000 5000 --budgets 10 50 200 --k 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_matching import random_euclidean
+from blockage_index import BlockageIndex
+from christofides import apply_christophides
+from cnn_algorithm import apply_cnn
+from instance import Instance
+from instrumentation import Tracer
+from local_search import improve_tour, neighbour_lists
+from routage_cyclique import apply_routage_cyclique_ids
+from utils import sample_pairs
+
+DEFAULT_SIZES = [100, 500, 1000, 2000]
+DEFAULT_BUDGETS = [5, 20, 100, None] # milliseconds, None runs until a local optimum
+
+
+def solve(matrix, tour, blockages):
+    """cost of CR and CNN on the tour, None when the algorithm fails"""
+    instance = Instance(matrix, blockages)
+    costs = []
+    for run in (lambda: apply_routage_cyclique_ids(tour, blockages), lambda: apply_cnn(matrix, blockages, tour)):
+        try:
+            path = run()
+            costs.append(None if -1 in path else instance.cost(path))
+        except Exception:
+            costs.append(None)
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="local search benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--budgets", type=float, nargs="+", default=None,
+                        help="budgets in milliseconds (local optimum if not given, plus 5 20 100 by default)")
+    parser.add_argument("--k", type=int, default=8, help="size of the candidate lists")
+    parser.add_argument("--density", type=float, default=0.01,
+                        help="blocked fraction of the edges for CR and CNN, 0 to skip them")
+    parser.add_argument("--blossom-max", type=int, default=1000,
+                        help="largest n for which the exact blossom is used (knn matching above)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    budgets = DEFAULT_BUDGETS if args.budgets is None else args.budgets
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'n':>6} {'budget (ms)':>11} {'before':>9} {'after':>9} {'gain %':>7} {'time (ms)':>10} "
+          f"{'gain/ms':>8} {'2-opt':>6} {'or-opt':>6} {'CR':>17} {'CNN':>17}")
+    for n in args.sizes:
+        matrix = random_euclidean(n, rng)
+        tour = apply_christophides(matrix, matching="blossom" if n <= args.blossom_max else "knn")
+        blockages = None
+        if args.density > 0:
+            pairs = sample_pairs(n, int(args.density * n * (n - 1) / 2), rng)
+            blockages = BlockageIndex.from_pairs(pairs, n)
+            base = solve(matrix, tour, blockages)
+
+        start = time.perf_counter()
+        neighbours = neighbour_lists(matrix, args.k)
+        t_lists = (time.perf_counter() - start) * 1000
+        print(f"{n:>6} neighbour lists: {t_lists:.1f} ms")
+
+        for budget in budgets:
+            tracer = Tracer()
+            start = time.perf_counter()
+            improved = improve_tour(matrix, tour, budget=None if budget is None else budget / 1000,
+                                    neighbours=neighbours, tracer=tracer)
+            elapsed = (time.perf_counter() - start) * 1000
+            stats = tracer.stats
+            before, after = stats.tour_cost_before, stats.tour_cost_after
+
+            solvers = ["-", "-"]
+            if blockages is not None:
+                costs = solve(matrix, improved, blockages)
+                solvers = [f"{b} -> {a}" for b, a in zip(base, costs)]
+            label = "-" if budget is None else f"{budget:g}"
+            print(f"{n:>6} {label:>11} {before:>9.0f} {after:>9.0f} {100 * (before - after) / before:>7.2f} "
+                  f"{elapsed:>10.1f} {stats.gain_per_ms:>8.2f} {stats.two_opt_moves:>6} {stats.or_opt_moves:>6} "
+                  f"{solvers[0]:>17} {solvers[1]:>17}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compare the matching backends of christofides.minimum_weight_matching
+each run reports the time of the matching, the time of the whole christofides
+and the cost of the resulting tour
+
+run from the root of the project:
+    python -m benchmarks.bench_matching
+    python -m benchmarks.bench_matching --sizes 200 1000 --methods greedy knn --k 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from christofides import ACPM, compute_impair_vertices, minimum_weight_matching, apply_christophides
+from utils import calculate_cost_matrix
+
+DEFAULT_SIZES = [100, 200, 500, 1000]
+METHODS = ["blossom", "greedy", "knn"]
+
+
+def random_euclidean(n, rng):
+    """integer euclidean distances between random points, a metric like the real instances"""
+    points = rng.uniform(0, 1000, size=(n, 2))
+    diff = points[:, None, :] - points[None, :, :]
+    return np.rint(np.sqrt((diff ** 2).sum(axis=-1))).astype(np.int32)
+
+
+def run_backend(graph, method, k):
+    """time of the matching stage, time of the full christofides and cost of the tour"""
+    odd_vertices = compute_impair_vertices(ACPM(graph))
+
+    start = time.perf_counter()
+    matching = minimum_weight_matching(graph, odd_vertices, method=method, k=k)
+    t_matching = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tour = apply_christophides(graph, matching=method, k=k)
+    t_total = time.perf_counter() - start
+
+    return {
+        "method": method,
+        "odd": len(odd_vertices),
+        "pairs": len(matching),
+        "matching_s": t_matching,
+        "christofides_s": t_total,
+        "cost": calculate_cost_matrix(tour, graph),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="matching backends benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=METHODS)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--blossom-max", type=int, default=1000,
+                        help="largest n for which the exact blossom is run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'n':>6} {'method':>8} {'odd':>6} {'matching (s)':>13} {'christofides (s)':>17} {'cost':>10} {'vs blossom':>11}")
+    for n in args.sizes:
+        graph = random_euclidean(n, rng)
+        reference = None
+        for method in args.methods:
+            if method == "blossom" and n > args.blossom_max:
+                continue
+            r = run_backend(graph, method, args.k)
+            if method == "blossom":
+                reference = r["cost"]
+            ratio = f"{r['cost'] / reference:.3f}" if reference else "-"
+            print(f"{n:>6} {method:>8} {r['odd']:>6} {r['matching_s']:>13.4f} "
+                  f"{r['christofides_s']:>17.4f} {r['cost']:>10} {ratio:>11}")
+
+
+if __name__ == "__main__":
+    main()
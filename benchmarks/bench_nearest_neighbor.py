@@ -0,0 +1,71 @@
+"""
+Benchmark of the vertex selection of cnn_algorithm.nearest_neighbor:
+python scan of G_prime[current] ("loop") against one masked argmin ("vectorized")
+
+G' is a random euclidean metric on |U| vertices without blockages, every leg is then
+the direct edge and the benchmark measures the selection itself
+
+run from the root of the project:
+    python -m benchmarks.bench_nearest_neighbor
+    python -m benchmarks.bench_nearest_neighbor --sizes 1000 10000 --loop-max 2000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from blockage_index import BlockageIndex
+from cnn_algorithm import nearest_neighbor
+
+DEFAULT_SIZES = [100, 500, 1000, 2000, 5000, 10000]
+
+
+class DirectPaths:
+    """paths of a metric without blockages: the direct edge is always a shortest path"""
+
+    def path(self, source, dest):
+        return [dest]
+
+
+def random_metric(n, rng):
+    """float32 euclidean distances, 400 MB for n = 10^4"""
+    points = rng.uniform(0, 1000, size=(n, 2)).astype(np.float32)
+    G = np.empty((n, n), dtype=np.float32)
+    for start in range(0, n, 1024):
+        diff = points[start:start + 1024, None, :] - points[None, :, :]
+        G[start:start + 1024] = np.sqrt((diff ** 2).sum(axis=-1))
+    return G
+
+
+def main():
+    parser = argparse.ArgumentParser(description="nearest_neighbor benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="sizes of U")
+    parser.add_argument("--loop-max", type=int, default=2000,
+                        help="largest |U| for which the python loop version is also timed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'|U|':>6} {'vectorized (s)':>15} {'loop (s)':>10} {'speedup':>8} {'same':>5}")
+    for size in args.sizes:
+        G = random_metric(size, rng)
+        U = list(range(size))
+        blockages = BlockageIndex.from_pairs(np.empty((0, 2), dtype=int), size)
+
+        start = time.perf_counter()
+        path_vec = nearest_neighbor(G, G, blockages, DirectPaths(), U)
+        t_vec = time.perf_counter() - start
+
+        if size <= args.loop_max:
+            start = time.perf_counter()
+            path_loop = nearest_neighbor(G, G, blockages, DirectPaths(), U, method="loop")
+            t_loop = time.perf_counter() - start
+            same = path_vec == path_loop
+            print(f"{size:>6} {t_vec:>15.4f} {t_loop:>10.4f} {t_loop / t_vec:>8.1f} {str(same):>5}")
+        else:
+            print(f"{size:>6} {t_vec:>15.4f} {'-':>10} {'-':>8} {'-':>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Stage-level benchmark of Christofides, CR and CNN: every stage is timed on its own and end-to-end,
+for several sizes n and densities of blockages (fraction of the edges that are blocked).
+
+The stages are timed by replacing the functions of the modules by timed wrappers, the algorithms
+themselves are not modified. A second run of each algorithm under tracemalloc gives the peak
+memory of every stage (numpy arrays included).
+
+The results are written in JSON, given a baseline (a previous output) the stages that are
+slower or use more memory than the tolerance are flagged and the exit code is 1.
+
+run from the root of the project:
+    python -m benchmarks.bench_stages --output stages.json
+    python -m benchmarks.bench_stages --sizes 50 100 --densities 0.1 --baseline stages.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import christofides
+import cnn_algorithm
+import routage_cyclique
+from blockage_index import BlockageIndex
+from utils import construct_alea_instance, sample_pairs
+
+DEFAULT_SIZES = [50, 100, 500, 1000, 5000]
+DEFAULT_DENSITIES = [0.01, 0.1, 0.3]
+
+# functions timed for each algorithm, looked up in the module that calls them
+STAGES = {
+    "christofides": (christofides, ["ACPM", "compute_impair_vertices", "minimum_weight_matching",
+                                    "build_multigraph_csr", "euler_tour_csr", "shortcut_tour"]),
+    "CR": (routage_cyclique, ["apply_first_iteration_ids", "apply_iteration_m_ids"]),
+    "CNN": (cnn_algorithm, ["shortcut", "compress", "nearest_neighbor"]),
+}
+
+
+class StageTimer:
+    """
+    replaces the stages of a module by wrappers that accumulate the time, the number of calls and
+    (when tracemalloc is running) the peak memory allocated during each stage
+    """
+
+    def __init__(self, module, names):
+        self.module = module
+        self.names = names
+        self.seconds = dict.fromkeys(names, 0.0)
+        self.calls = dict.fromkeys(names, 0)
+        self.peak = dict.fromkeys(names, 0)
+        self.total_peak = 0
+
+    def _wrap(self, name, function):
+        def timed(*args, **kwargs):
+            tracing = tracemalloc.is_tracing()
+            if tracing:
+                # the peak since the last reset belongs to the whole run
+                self.total_peak = max(self.total_peak, tracemalloc.get_traced_memory()[1] - self._base)
+                base = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.seconds[name] += time.perf_counter() - start
+                self.calls[name] += 1
+                if tracing:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    self.peak[name] = max(self.peak[name], peak - base)
+                    self.total_peak = max(self.total_peak, peak - self._base)
+        return timed
+
+    def __enter__(self):
+        self._originals = {name: getattr(self.module, name) for name in self.names}
+        for name, function in self._originals.items():
+            setattr(self.module, name, self._wrap(name, function))
+        self._base = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        return self
+
+    def finish(self):
+        """peak of the whole run, to be called at its end"""
+        if tracemalloc.is_tracing():
+            self.total_peak = max(self.total_peak, tracemalloc.get_traced_memory()[1] - self._base)
+
+    def __exit__(self, *exc):
+        for name, function in self._originals.items():
+            setattr(self.module, name, function)
+
+
+def run_algorithm(algorithm, matrix, tour, blockages, matching="blossom"):
+    """one run of the algorithm"""
+    if algorithm == "christofides":
+        return christofides.apply_christophides(matrix, matching=matching)
+    if algorithm == "CR":
+        return routage_cyclique.apply_routage_cyclique_ids(tour, blockages)
+    return cnn_algorithm.apply_cnn(matrix, blockages, tour)
+
+
+def measure(algorithm, matrix, tour, blockages, repeat, memory, matching="blossom"):
+    """
+    time every stage (best of repeat runs) then measure the peak memory in one traced run
+    return the result rows of the algorithm and its output
+    """
+    module, names = STAGES[algorithm]
+    best = None
+    error = None
+    output = None
+    for _ in range(repeat):
+        with StageTimer(module, names) as timer:
+            start = time.perf_counter()
+            try:
+                output = run_algorithm(algorithm, matrix, tour, blockages, matching)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            total = time.perf_counter() - start
+        if best is None or total < best[0]:
+            best = (total, timer)
+        if error is not None:
+            break
+
+    total, timer = best
+    peaks = None
+    if memory and error is None:
+        tracemalloc.start()
+        with StageTimer(module, names) as traced:
+            run_algorithm(algorithm, matrix, tour, blockages, matching)
+            traced.finish()
+        tracemalloc.stop()
+        peaks = traced
+
+    rows = []
+    for name in names:
+        rows.append({"algorithm": algorithm, "stage": name, "seconds": timer.seconds[name],
+                     "calls": timer.calls[name],
+                     "peak_mb": None if peaks is None else peaks.peak[name] / 1e6})
+    rows.append({"algorithm": algorithm, "stage": "total", "seconds": total, "calls": 1,
+                 "peak_mb": None if peaks is None else peaks.total_peak / 1e6, "error": error})
+    return rows, output
+
+
+def run(sizes, densities, seed, repeat, memory, matching="blossom", blossom_max=1000, log=print):
+    """
+    param:
+        matching: minimum_weight_matching method of christofides
+        blossom_max: above this size the "knn" matching is used instead of "blossom" (O(n^3))
+    return the list of the result rows
+    """
+    results = []
+    for n in sizes:
+        start = time.perf_counter()
+        matrix, _ = construct_alea_instance(n, 0, rng=seed, as_matrix=True)
+        log(f"n={n}: instance built in {time.perf_counter() - start:.1f}s")
+
+        method = "knn" if matching == "blossom" and n > blossom_max else matching
+        rows, tour = measure("christofides", matrix, None, None, repeat, memory, method)
+        for row in rows:
+            results.append({"n": n, "density": None, "blockages": 0, "matching": method, **row})
+
+        for density in densities:
+            k = int(density * n * (n - 1) // 2)
+            pairs = sample_pairs(n, k, np.random.default_rng([seed, n, k]))
+            blockages = BlockageIndex.from_pairs(pairs, n)
+            for algorithm in ("CR", "CNN"):
+                rows, _ = measure(algorithm, matrix, list(tour), blockages, repeat, memory)
+                for row in rows:
+                    results.append({"n": n, "density": density, "blockages": k, "matching": method, **row})
+                total = rows[-1]
+                log(f"n={n} density={density} {algorithm}: {total['seconds']:.3f}s"
+                    + (f" {total['error']}" if total["error"] else ""))
+    return results
+
+
+def row_key(row):
+    return (row["n"], row["density"], row.get("matching"), row["algorithm"], row["stage"])
+
+
+def compare(results, baseline, tolerance, min_seconds, min_mb):
+    """
+    the rows of results slower (or using more memory) than the baseline by more than tolerance,
+    very short stages (< min_seconds) and small allocations (< min_mb) are not compared
+    """
+    previous = {row_key(row): row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        old = previous.get(row_key(row))
+        if old is None:
+            continue
+        if row["seconds"] >= min_seconds and row["seconds"] > old["seconds"] * (1 + tolerance):
+            regressions.append((row, "seconds", old["seconds"], row["seconds"]))
+        if (row.get("peak_mb") is not None and old.get("peak_mb") is not None
+                and row["peak_mb"] >= min_mb and row["peak_mb"] > old["peak_mb"] * (1 + tolerance)):
+            regressions.append((row, "peak_mb", old["peak_mb"], row["peak_mb"]))
+    return regressions
+
+
+def print_table(results):
+    print(f"{'n':>6} {'density':>8} {'algorithm':>12} {'stage':>26} {'seconds':>10} {'calls':>7} {'peak (MB)':>10}")
+    for row in results:
+        density = "-" if row["density"] is None else row["density"]
+        peak = "-" if row["peak_mb"] is None else f"{row['peak_mb']:.2f}"
+        print(f"{row['n']:>6} {density:>8} {row['algorithm']:>12} {row['stage']:>26} "
+              f"{row['seconds']:>10.4f} {row['calls']:>7} {peak:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stage-level benchmark of Christofides, CR and CNN")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--densities", type=float, nargs="+", default=DEFAULT_DENSITIES,
+                        help="fractions of the edges that are blocked")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="the best of repeat runs is kept")
+    parser.add_argument("--matching", default="blossom", choices=["blossom", "greedy", "knn"])
+    parser.add_argument("--blossom-max", type=int, default=1000,
+                        help="largest n for which the blossom matching is used, knn above")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--output", default=None, help="JSON file of the results")
+    parser.add_argument("--baseline", default=None, help="JSON results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative slowdown (or memory increase) flagged as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.005)
+    parser.add_argument("--min-mb", type=float, default=1.0)
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.densities, args.seed, args.repeat, not args.no_memory,
+                  args.matching, args.blossom_max)
+    print_table(results)
+
+    if args.output is not None:
+        report = {
+            "meta": {"python": platform.python_version(), "numpy": np.__version__,
+                     "machine": platform.machine(), "processor": platform.processor(),
+                     "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args)},
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"results written to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_seconds, args.min_mb)
+        for row, metric, old, new in regressions:
+            density = "-" if row["density"] is None else row["density"]
+            print(f"REGRESSION n={row['n']} density={density} {row['algorithm']}.{row['stage']} "
+                  f"{metric}: {old:.4f} -> {new:.4f} (x{new / old if old else float('inf'):.2f})")
+        if regressions:
+            sys.exit(1)
+        print(f"no regression against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import numpy as np
+
+# approximate size of one orientation of a blocked edge in a python set of tuples
+SET_BYTES_PER_ARC = 100
+
+
+class BlockageIndex:
+    """
+    O(1) lookup of the blocked edges shared by CR and CNN, built once from the blockage list.
+    The blockages are symmetric, giving [A,B] is enough to block A-B and B-A.
+    Two representations of the same index:
+        "set": python set of the blocked pairs (both directions), for small instances
+        "bitmap": packed-bit n x n symmetric bitmap, 1 bit per pair, for large instances
+    In both cases the blocked neighbours of each vertex are kept in CSR form
+    (offsets, neighbours) so that a vertex can list its blocked edges in O(degree).
+
+    The index can be used as the old list of blockages: [A,B] in index
+    with the labels of the routes (from_labels) or with the vertex indices.
+    """
+
+    def __init__(self, pairs, n, labels=None, mode="auto"):
+        """
+        param:
+            pairs: 2D array of vertex indices e.g [[0,3],[2,4]] means 0-3 and 2-4 are blocked
+            n: number of vertices
+            labels: optional list of the label of each vertex, used by 'in' to translate labels
+            mode: "set", "bitmap" or "auto" (the representation that uses the less memory)
+        """
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        pairs = np.sort(pairs, axis=1)
+        pairs = np.unique(pairs[pairs[:, 0] != pairs[:, 1]], axis=0)
+
+        self.n = n
+        self.pairs = pairs # canonical pairs (min, max), each blocked edge once
+        self.labels = None if labels is None else list(labels)
+        self._ids = None if labels is None else {label: i for i, label in enumerate(self.labels)}
+
+        if mode == "auto":
+            bitmap_bytes = n * ((n + 7) // 8)
+            set_bytes = 2 * len(pairs) * SET_BYTES_PER_ARC
+            mode = "bitmap" if bitmap_bytes < set_bytes else "set"
+        if mode not in ("set", "bitmap"):
+            raise ValueError(f"Unknown BlockageIndex mode: {mode}")
+        self.mode = mode
+
+        # both directions of every blocked edge
+        src = np.concatenate([pairs[:, 0], pairs[:, 1]])
+        dst = np.concatenate([pairs[:, 1], pairs[:, 0]])
+
+        if mode == "set":
+            self._set = set(zip(src.tolist(), dst.tolist()))
+        else:
+            self._stride = (n + 7) // 8
+            bits = np.zeros((n, self._stride), dtype=np.uint8)
+            np.bitwise_or.at(bits, (src, dst >> 3), (128 >> (dst & 7)).astype(np.uint8))
+            self._bits = bytearray(bits.tobytes())
+
+        # blocked neighbours of each vertex (CSR), sorted by vertex
+        order = np.lexsort((dst, src))
+        self.offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.offsets[1:])
+        self.neighbours = dst[order]
+
+    @classmethod
+    def from_labels(cls, blockages, base_tuple, mode="auto", keep_labels=True):
+        """
+        build the index from the blockages given with the labels of the routes
+        param:
+            blockages: 2D array of labels e.g [ ['A','B'],['A','C'] ], only one direction is needed
+            base_tuple: the routes dict, its keys give the index of each label
+            keep_labels: if False 'in' expects vertex indices (CNN works on indices)
+        """
+        labels = list(base_tuple.keys())
+        ids = {label: i for i, label in enumerate(labels)}
+        pairs = [[ids[s], ids[d]] for s, d in blockages]
+        return cls(pairs, len(labels), labels=labels if keep_labels else None, mode=mode)
+
+    @classmethod
+    def from_pairs(cls, pairs, n, mode="auto"):
+        """build the index from the blockages given as vertex indices"""
+        return cls(pairs, n, mode=mode)
+
+    @classmethod
+    def from_mask(cls, mask, mode="auto"):
+        """
+        build the index from a dense n x n boolean mask of the blocked edges (symmetric, false diagonal),
+        for the instances where most of the edges are blocked (e.g Gp+ of graphe_du_papier):
+        no sort of the pairs, the bitmap is the packed mask and the CSR is read row by row.
+        The pairs and the neighbours are int32 when n allows it.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        n = len(mask)
+        if mask.shape != (n, n):
+            raise ValueError(f"The mask must be square, got shape {mask.shape}")
+        if mask.diagonal().any():
+            raise ValueError("The diagonal of the mask must be false")
+
+        pairs = pairs_from_mask(mask)
+        if mode == "auto":
+            mode = "bitmap" if n * ((n + 7) // 8) < 2 * len(pairs) * SET_BYTES_PER_ARC else "set"
+        if mode != "bitmap":
+            return cls(pairs, n, mode=mode)
+
+        index = cls.__new__(cls)
+        index.n = n
+        index.pairs = pairs
+        index.labels = None
+        index._ids = None
+        index.mode = "bitmap"
+        index._stride = (n + 7) // 8
+        index._bits = bytearray(np.packbits(mask, axis=1).tobytes()) # same bit order as __init__
+
+        index.offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(mask.sum(axis=1), out=index.offsets[1:])
+        index.neighbours = np.empty(index.offsets[-1], dtype=pairs.dtype)
+        for start, stop in _row_blocks(n):
+            index.neighbours[index.offsets[start]:index.offsets[stop]] = np.nonzero(mask[start:stop])[1]
+        return index
+
+    def is_blocked(self, a, b):
+        """True if the edge between the vertex indices a and b is blocked"""
+        if self.mode == "set":
+            return (a, b) in self._set
+        return bool(self._bits[a * self._stride + (b >> 3)] & (128 >> (b & 7)))
+
+    def __contains__(self, edge):
+        """[a,b] in index, with labels if the index has been built with labels"""
+        a, b = edge
+        if self._ids is not None:
+            a = self._ids.get(a)
+            b = self._ids.get(b)
+            if a is None or b is None:
+                return False
+        return self.is_blocked(int(a), int(b))
+
+    def neighbors(self, v):
+        """1D array of the vertices x such that v-x is blocked"""
+        return self.neighbours[self.offsets[v]:self.offsets[v + 1]]
+
+    def degree(self, v):
+        """number of blocked edges incident to v"""
+        return int(self.offsets[v + 1] - self.offsets[v])
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __repr__(self):
+        return f"BlockageIndex(n={self.n}, blocked={len(self)}, mode={self.mode!r})"
+
+
+def _row_blocks(n, entries=2 ** 22):
+    """(start, stop) of blocks of rows of a n x n array with about 'entries' entries each"""
+    rows = max(1, entries // max(n, 1))
+    for start in range(0, n, rows):
+        yield start, min(start + rows, n)
+
+
+def pairs_from_mask(mask):
+    """
+    canonical pairs (min, max) of a symmetric boolean mask of the blocked edges, sorted like the
+    pairs of BlockageIndex, int32 when n allows it. The mask is read by blocks of rows so that only
+    the pairs are allocated (and not the int64 indices of every blocked entry).
+    """
+    mask = np.asarray(mask, dtype=bool)
+    n = len(mask)
+    dtype = np.int32 if n < 2 ** 31 else np.int64
+    k = sum(np.count_nonzero(np.triu(mask[start:stop], start + 1)) for start, stop in _row_blocks(n))
+    pairs = np.empty((k, 2), dtype=dtype)
+    written = 0
+    for start, stop in _row_blocks(n):
+        rows, cols = np.nonzero(np.triu(mask[start:stop], start + 1))
+        pairs[written:written + len(rows), 0] = rows + start
+        pairs[written:written + len(rows), 1] = cols
+        written += len(rows)
+    return pairs
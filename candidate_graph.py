@@ -0,0 +1,316 @@
+"""
+Christofides for the large instances (n = 50k ...) where the dense n x n matrix does not fit in memory
+(10 GB of int32 at n = 50k), on a sparse candidate graph: the k nearest neighbours of each vertex.
+
+    - the neighbours are read from a row provider (a np.memmap of a corpus, a DistanceRows, any object
+      with rows(vertices)) by blocks of rows, or from coordinates (PointDistances, with a KD-tree)
+    - the minimum spanning tree is the one of the candidate graph, its components are joined by the
+      cheapest edge between a component and the rest if the graph is not connected
+    - the matching of the odd vertices only uses the k nearest odd vertices of each one
+The memory is O(n.k) plus one block of rows, the tour is compared with the dense christofides
+in benchmarks/bench_large_christofides (on the sizes where both fit).
+
+    tour = christofides_knn(PointDistances(points), k=10)
+    tour = christofides_knn(np.load("matrix.npy", mmap_mode="r"))
+scipy is imported in the functions that use it, importing this module (for PointDistances) stays cheap.
+"""
+import numpy as np
+
+from christofides import blossom_matching, greedy_matching, build_multigraph_csr, euler_tour_csr, shortcut_tour
+from instrumentation import get_tracer
+from sparse_graph import tree_odd_vertices
+
+# scipy.sparse.csgraph reads a 0 weight as a missing edge, the equal points are joined with this weight
+ZERO_WEIGHT = 1e-12
+# entries of the matrix read at once
+BLOCK_ENTRIES = 2 ** 22
+
+
+class PointDistances:
+    """
+    lazy euclidean distance matrix of n points (n x d coordinates), O(n.d) memory.
+    It can be used where the algorithms expect a weight matrix, like DistanceRows:
+    points[u, v], points[np.ix_(r, c)], points[u] (a row), rows(vertices), len(points)
+    """
+
+    def __init__(self, points):
+        """
+        param:
+            points: 2D array (n, d) of the coordinates
+        """
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        if self.points.ndim != 2:
+            raise ValueError(f"The points must be a 2D array (n, d), got shape {self.points.shape}")
+        self.n = len(self.points)
+        self._tree = None
+
+    @property
+    def shape(self):
+        return (self.n, self.n)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float64)
+
+    @property
+    def tree(self):
+        """KD-tree of the points, built the first time it is needed"""
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.points)
+        return self._tree
+
+    def distances(self, a, b):
+        """distances between the vertices of a and b (broadcast)"""
+        diff = self.points[np.asarray(a)] - self.points[np.asarray(b)]
+        return np.sqrt((diff ** 2).sum(axis=-1))
+
+    def row(self, v):
+        return self.distances(np.arange(self.n), int(v))
+
+    def rows(self, vertices):
+        """2D array of the rows of vertices, one coordinate at a time (no (rows, n, d) array)"""
+        vertices = np.asarray(vertices, dtype=int)
+        out = np.zeros((len(vertices), self.n))
+        for j in range(self.points.shape[1]):
+            out += (self.points[vertices, j][:, None] - self.points[:, j]) ** 2
+        return np.sqrt(out, out=out)
+
+    def nearest(self, k, vertices=None):
+        """
+        the k nearest neighbours of each vertex among vertices (all by default), itself excluded
+        return (indices, distances) 2D arrays (len(vertices), k), sorted by distance, local indices
+        """
+        points = self.points if vertices is None else self.points[np.asarray(vertices, dtype=int)]
+        if vertices is None:
+            tree = self.tree
+        else:
+            from scipy.spatial import cKDTree
+            tree = cKDTree(points)
+        k = min(k, len(points) - 1)
+        if k <= 0:
+            return np.empty((len(points), 0), dtype=np.int64), np.empty((len(points), 0))
+        dist, idx = tree.query(points, k=k + 1)
+        # the vertex itself is usually first, but not always with equal points
+        keep = idx != np.arange(len(points))[:, None]
+        keep[keep.all(axis=1), -1] = False
+        return idx[keep].reshape(-1, k).astype(np.int64), dist[keep].reshape(-1, k)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows, cols = key
+            return self.distances(rows, cols)
+        return self.row(key)
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return f"PointDistances(n={self.n}, d={self.points.shape[1]})"
+
+
+def read_rows(source, vertices):
+    """rows of the vertices as a float array: source.rows for a lazy matrix, fancy indexing otherwise (memmap ...)"""
+    vertices = np.asarray(vertices, dtype=int)
+    if hasattr(source, "rows"):
+        return np.asarray(source.rows(vertices), dtype=float)
+    return np.asarray(source[vertices], dtype=float)
+
+
+def read_submatrix(source, vertices, block=BLOCK_ENTRIES):
+    """dense source[vertices, vertices] read by blocks of rows (only len(vertices)^2 entries are kept)"""
+    vertices = np.asarray(vertices, dtype=int)
+    size = len(vertices)
+    sub = np.empty((size, size))
+    rows = max(1, block // len(source))
+    for start in range(0, size, rows):
+        sub[start:start + rows] = read_rows(source, vertices[start:start + rows])[:, vertices]
+    return sub
+
+
+def knn_candidates(source, k=10, vertices=None, block=BLOCK_ENTRIES):
+    """
+    the k nearest neighbours of each vertex among vertices (all by default)
+    param:
+        source: PointDistances (KD-tree), or a weight matrix / row provider read by blocks of rows
+        k: number of neighbours
+        vertices: optional subset of the vertices, the neighbours are searched in it
+    return (nearest, distances) 2D arrays (len(vertices), k) sorted by distance, local indices in vertices
+    """
+    if hasattr(source, "nearest"):
+        return source.nearest(k, vertices)
+
+    n = len(source)
+    vertices = np.arange(n) if vertices is None else np.asarray(vertices, dtype=int)
+    size = len(vertices)
+    k = min(k, size - 1)
+    nearest = np.empty((size, max(k, 0)), dtype=np.int64)
+    distances = np.empty((size, max(k, 0)))
+    if k <= 0:
+        return nearest, distances
+
+    rows = max(1, block // n)
+    for start in range(0, size, rows):
+        stop = min(start + rows, size)
+        dist = read_rows(source, vertices[start:stop])
+        if size != n:
+            dist = dist[:, vertices]
+        dist[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        part = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        part_dist = np.take_along_axis(dist, part, axis=1)
+        order = np.argsort(part_dist, axis=1, kind="stable")
+        nearest[start:stop] = np.take_along_axis(part, order, axis=1)
+        distances[start:stop] = np.take_along_axis(part_dist, order, axis=1)
+    return nearest, distances
+
+
+def candidate_edges(nearest, distances):
+    """each undirected edge of the k nearest neighbours once, (lo, hi, weights)"""
+    size, k = nearest.shape
+    src = np.repeat(np.arange(size), k)
+    dst = nearest.ravel()
+    lo, hi = np.minimum(src, dst), np.maximum(src, dst)
+    pairs, first = np.unique(np.column_stack([lo, hi]), axis=0, return_index=True)
+    return pairs[:, 0], pairs[:, 1], distances.ravel()[first]
+
+
+def candidate_graph(source, k=10):
+    """symmetric csr_array of the k nearest neighbours graph of the source"""
+    from scipy.sparse import csr_array
+
+    n = len(source)
+    lo, hi, weights = candidate_edges(*knn_candidates(source, k))
+    weights = np.maximum(weights, ZERO_WEIGHT)
+    graph = csr_array((np.concatenate([weights, weights]), (np.concatenate([lo, hi]), np.concatenate([hi, lo]))),
+                      shape=(n, n))
+    return graph
+
+
+def connect_components(source, graph, block=BLOCK_ENTRIES):
+    """
+    add to the candidate graph the cheapest edge between each component (but the largest one)
+    and the rest of the vertices, until it is connected (each round at least halves the components)
+    return (graph, number of edges added)
+    """
+    from scipy.sparse import csr_array
+    from scipy.sparse.csgraph import connected_components
+
+    n = graph.shape[0]
+    added = 0
+    while True:
+        count, labels = connected_components(graph, directed=False)
+        if count == 1:
+            return graph, added
+        largest = np.argmax(np.bincount(labels))
+
+        src, dst, weights = [], [], []
+        rows = max(1, block // n)
+        for c in range(count):
+            if c == largest:
+                continue
+            members = np.flatnonzero(labels == c)
+            best = (np.inf, -1, -1)
+            for start in range(0, len(members), rows):
+                block_members = members[start:start + rows]
+                dist = read_rows(source, block_members)
+                dist[:, labels == c] = np.inf
+                i, j = np.unravel_index(np.argmin(dist), dist.shape)
+                if dist[i, j] < best[0]:
+                    best = (dist[i, j], block_members[i], j)
+            weights.append(max(best[0], ZERO_WEIGHT))
+            src.append(best[1])
+            dst.append(best[2])
+
+        added += len(src)
+        extra = csr_array((np.concatenate([weights, weights]), (np.concatenate([src, dst]), np.concatenate([dst, src]))),
+                          shape=(n, n))
+        graph = graph.maximum(extra).tocsr()
+
+
+def greedy_pairs(lo, hi, weights, size):
+    """greedy matching on the given edges (sorted by weight), return 2D array of local indices"""
+    order = np.argsort(weights, kind="stable")
+    is_matched = bytearray(size)
+    res = []
+    for a, b in zip(lo[order].tolist(), hi[order].tolist()):
+        if not is_matched[a] and not is_matched[b]:
+            is_matched[a] = is_matched[b] = 1
+            res.append([a, b])
+    return np.array(res, dtype=int).reshape(-1, 2)
+
+
+def candidate_matching(source, vertices, k=10, method="greedy", dense_max=2000):
+    """
+    perfect matching of the vertices (even count) restricted to the k nearest neighbours of each one,
+    like christofides.knn_matching without the dense submatrix: the vertices left unmatched are matched
+    again on their own k nearest neighbours, after the first round the last dense_max at most are matched
+    on their dense submatrix (greedy)
+    param:
+        method: "greedy" (edges sorted by weight) or "blossom" (networkx, exact on the candidates but slow)
+    return 2D array of the matched pairs (vertex indices)
+    """
+    if method not in ("greedy", "blossom"):
+        raise ValueError(f"Unknown candidate matching method: {method}")
+    left = np.asarray(vertices, dtype=int)
+    res = [np.empty((0, 2), dtype=int)]
+
+    while len(left) > k + 1 and (len(res) == 1 or len(left) > dense_max):
+        lo, hi, weights = candidate_edges(*knn_candidates(source, k, vertices=left))
+        if method == "blossom":
+            pairs = blossom_matching(None, lo, hi, labels=np.arange(len(left)), weights=weights)
+        else:
+            pairs = greedy_pairs(lo, hi, weights, len(left))
+        res.append(left[pairs].reshape(-1, 2))
+        matched = np.zeros(len(left), dtype=bool)
+        matched[pairs.ravel()] = True
+        left = left[~matched]
+
+    if len(left) > 0:
+        sub = read_submatrix(source, left)
+        res.append(left[greedy_matching(sub)].reshape(-1, 2))
+    return np.concatenate(res)
+
+
+def christofides_knn(source, k=10, start_vertex=0, matching="greedy", tracer=None):
+    """
+    christofides tour on the k nearest neighbours candidate graph, for the large instances
+    param:
+        source: PointDistances, weight matrix (e.g np.memmap) or row provider (rows(vertices) and len)
+        k: number of neighbours of each vertex in the candidate graph and in the matching
+        start_vertex: the vertex at which the tour starts and ends
+        matching: "greedy" or "blossom" on the candidate edges of the odd vertices
+        tracer: optional instrumentation.Tracer, gets the time of each stage, the number of candidate edges,
+        of components joined, the matching size and the tour length
+    return the tour e.g [0,4,2,1,3,0]
+    """
+    from scipy.sparse.csgraph import minimum_spanning_tree, breadth_first_order
+
+    tracer = get_tracer(tracer)
+    n = len(source)
+    if n == 1:
+        return [start_vertex, start_vertex]
+
+    with tracer.stage("candidate_graph"):
+        graph = candidate_graph(source, k)
+    with tracer.stage("ACPM"):
+        graph, joined = connect_components(source, graph)
+        tree = minimum_spanning_tree(graph)
+        _, pred = breadth_first_order(tree, start_vertex, directed=False, return_predecessors=True)
+        pred = np.where(pred < 0, -1, pred)
+
+    with tracer.stage("compute_impair_vertices"):
+        odd_vertices = tree_odd_vertices(pred)
+
+    with tracer.stage("minimum_weight_matching"):
+        matching_M = candidate_matching(source, odd_vertices, k=k, method=matching)
+
+    with tracer.stage("euler_tour"):
+        offsets, targets = build_multigraph_csr(matching_M, pred, n)
+        tour = euler_tour_csr(offsets, targets, start_vertex=start_vertex)
+        tour = shortcut_tour(tour, n)
+
+    tracer.stats.set("candidate_edges", graph.nnz // 2)
+    tracer.stats.set("components_joined", joined)
+    tracer.stats.set("matching_size", len(matching_M))
+    tracer.stats.set("tour_length", len(tour))
+    return tour
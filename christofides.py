@@ -1,14 +1,21 @@
 import numpy as np
-import networkx as nx
+from instrumentation import get_tracer
 
-def ACPM(graph,s=0):
+def ACPM(graph,s=0,method="vectorized"):
     """
     Minimum Spanning Tree
     Prim's algorithm
     param:
         graph: 2D complete array
         s: the index at which we should start. It can be random, but good to specify for debugging
+        method: "vectorized" (default) relaxes the whole key array at each step,
+        "loop" is the original implementation, both return exactly the same predecessors
     """
+    if method == "vectorized":
+        return acpm_vectorized(graph,s=s)
+    if method != "loop":
+        raise ValueError(f"Unknown ACPM method: {method}")
+
     couts = np.array([float('inf')] * len(graph))
     predecesor = [-1] * len(graph)
 
@@ -34,6 +41,43 @@ def ACPM(graph,s=0):
     return np.array(predecesor)
 
 
+def acpm_vectorized(graph,s=0):
+    """
+    Prim's algorithm in O(n^2) with one vectorized relaxation per step
+    instead of deleting from Q and relaxing the neighbours in a python loop.
+    param:
+        graph: 2D complete array (int32, int64, float32, float64 ...)
+        s: the index at which we should start
+    return the same predecessor array as ACPM(graph,s,method="loop")
+    """
+    graph = np.asarray(graph)
+    n = len(graph)
+
+    # float64 keys represent int32 and float32 weights exactly
+    couts = np.full(n, np.inf)
+    predecesor = np.full(n, -1, dtype=int)
+    in_tree = np.zeros(n, dtype=bool)
+    couts[s] = 0
+
+    for _ in range(n):
+        # the vertices already in the tree keep an infinite key,
+        # argmin returns the smallest index on ties just like argmin(couts[Q])
+        idx_vertex = np.argmin(couts)
+        if in_tree[idx_vertex]:
+            # every remaining key is infinite, the loop version takes the first one of Q
+            idx_vertex = np.argmin(in_tree)
+        in_tree[idx_vertex] = True
+        couts[idx_vertex] = np.inf
+
+        # strict '<' as in the loop version so the predecessors are identical
+        edges = graph[idx_vertex]
+        improve = (edges < couts) & ~in_tree
+        couts = np.where(improve, edges, couts)
+        predecesor[improve] = idx_vertex
+
+    return predecesor
+
+
 def compute_impair_vertices(acpm_tree):
     """
     calculer l'ensemble de degrés impaires
@@ -65,25 +109,141 @@ def compute_impair_vertices(acpm_tree):
 
     return odd_vertices
 
-def minimum_weight_matching(graph,vertices):
+def minimum_weight_matching(graph,vertices,method="blossom",k=10):
     """
-    bossom algorithm to find the minimum weight matching 
+    perfect matching of minimum weight between the vertices of odd degree
     param:
         graph 2D array where i,j is the weight for the edge (i,j)
         vertices: index of the vertex of odd degree
+        method: "blossom" exact matching (networkx),
+                "greedy" greedy matching on the edges sorted by weight,
+                "knn" blossom restricted to the k nearest neighbours of each vertex,
+                the vertices left unmatched are then matched greedily
+        k: number of candidate neighbours for the "knn" method
 
     return 2D array e.g [[0,3], [2,4]] means 0 and 3 are linked, 2 and 4 are linked and it's the minimum weight 
     """
+    vertices = np.asarray(vertices,dtype=int)
+    sub = np.asarray(graph)[np.ix_(vertices,vertices)]
+
+    if method == "blossom":
+        # the vertices are used as node names so networkx returns the pairs in the same order as before
+        return blossom_matching(sub,labels=vertices)
+    elif method == "greedy":
+        pairs = greedy_matching(sub)
+    elif method == "knn":
+        pairs = knn_matching(sub,k=k)
+    else:
+        raise ValueError(f"Unknown matching method: {method}")
+
+    return vertices[pairs].reshape(-1,2)
+
+
+def _upper_edges(sub):
+    """the edges (i,j) with i < j of a square submatrix and their weights"""
+    rows,cols = np.triu_indices(len(sub),k=1)
+    return rows,cols,sub[rows,cols]
+
+
+def blossom_matching(sub,rows=None,cols=None,labels=None,weights=None):
+    """
+    exact minimum weight matching (networkx blossom) on the submatrix of the odd vertices
+    only the edges i < j are added, no self-loops and each edge once
+    param:
+        sub: 2D array, the weights between the odd vertices (None if weights and labels are given)
+        rows, cols: optional candidate edges, by default every pair i < j
+        labels: optional 1D array, the name of each vertex in the returned pairs
+        weights: optional weights of the candidate edges, read in sub by default
+    return 2D array of local indices (or of labels)
+    """
+    if rows is None:
+        rows,cols,weights = _upper_edges(sub)
+    elif weights is None:
+        weights = sub[rows,cols]
+    if labels is None:
+        labels = np.arange(len(sub))
+    labels = np.asarray(labels)
+
+    import networkx as nx # imported here, it is slow to import and only the exact matching needs it
     G = nx.Graph()
-    G.add_nodes_from(vertices)
-    for source in vertices:
-        for dest in vertices:
-            G.add_edge(source, dest, weight=graph[source,dest])
-    
+    G.add_nodes_from(labels.tolist())
+    G.add_weighted_edges_from(zip(labels[rows].tolist(),labels[cols].tolist(),weights.tolist()))
+
     ret = nx.min_weight_matching(G)
 
-    return np.array(list(ret),dtype=int)
-    
+    return np.array(list(ret),dtype=int).reshape(-1,2)
+
+
+def greedy_matching(sub,rows=None,cols=None,matched=None):
+    """
+    greedy matching: the edges are sorted by weight and an edge is taken
+    if none of its two vertices is already matched
+    param:
+        sub: 2D array, the weights between the odd vertices
+        rows, cols: optional candidate edges, by default every pair i < j
+        matched: optional boolean array of the vertices already matched
+    return 2D array of local indices
+    """
+    if rows is None:
+        rows,cols,weights = _upper_edges(sub)
+    else:
+        weights = sub[rows,cols]
+    if matched is None:
+        matched = np.zeros(len(sub),dtype=bool)
+
+    order = np.argsort(weights,kind='stable')
+    is_matched = matched.tolist()
+    remaining = len(sub) - int(matched.sum())
+    res = []
+
+    for a,b in zip(rows[order].tolist(),cols[order].tolist()):
+        if remaining < 2:
+            break
+        if not is_matched[a] and not is_matched[b]:
+            is_matched[a] = is_matched[b] = True
+            remaining -= 2
+            res.append([a,b])
+
+    return np.array(res,dtype=int).reshape(-1,2)
+
+
+def knn_matching(sub,k=10):
+    """
+    blossom matching restricted to the candidate edges between each vertex and its
+    k nearest neighbours, the sparse graph makes the blossom much faster.
+    The candidate graph might not have a perfect matching, the vertices left
+    are matched greedily with every remaining edge.
+    param:
+        sub: 2D array, the weights between the odd vertices
+        k: number of nearest neighbours of each vertex
+    return 2D array of local indices
+    """
+    size = len(sub)
+    if size <= k + 1:
+        return blossom_matching(sub)
+
+    # k nearest neighbours of each vertex, itself excluded
+    # float32 storage keeps a float32 copy (exact), the integers are compared in float64
+    dist = np.array(sub,dtype=np.result_type(sub.dtype,np.float32))
+    np.fill_diagonal(dist,np.inf)
+    nearest = np.argpartition(dist,k,axis=1)[:,:k]
+
+    rows = np.repeat(np.arange(size),k)
+    cols = nearest.ravel()
+    rows,cols = np.minimum(rows,cols),np.maximum(rows,cols)
+    pairs = np.unique(np.column_stack([rows,cols]),axis=0)
+
+    res = blossom_matching(sub,pairs[:,0],pairs[:,1])
+
+    matched = np.zeros(size,dtype=bool)
+    matched[res.ravel()] = True
+    if not matched.all():
+        left = np.flatnonzero(~matched)
+        rest = greedy_matching(sub[np.ix_(left,left)])
+        res = np.concatenate([res,left[rest].reshape(-1,2)])
+
+    return res
+
 
 def unite_matching_acpm(matching_M,acpm_T,graph):
     """
@@ -168,49 +328,179 @@ def remove_repeated_vertices_euleur(tour):
     return tour.tolist()
 
 
-def apply_christophides(arbre):
+def build_multigraph_csr(matching_M,acpm_T,n):
+    """
+    CSR form of the multigraph ACPM + matching (same content as unite_matching_acpm)
+    every undirected edge is stored as two arcs, the arcs of a vertex keep the order
+    in which unite_matching_acpm appends them so the euler tour is the same
+    param:
+        matching_M: 2D array of the matched pairs e.g [[0,3], [2,4]]
+        acpm_T: 1D array, the predecessor of each vertex in the ACPM (-1 for the root)
+        n: number of vertices
+    return:
+        offsets: 1D array of size n+1, the arcs of u are targets[offsets[u]:offsets[u+1]]
+        targets: 1D array, the destination of each arc
+    """
+    acpm_T = np.asarray(acpm_T)
+    matching_M = np.asarray(matching_M,dtype=int).reshape(-1,2)
+
+    children = np.flatnonzero(acpm_T != -1)
+    parents = acpm_T[children]
+
+    # arcs in the order of unite_matching_acpm: (i -> pred), (pred -> i) then (a -> b), (b -> a)
+    src = np.concatenate([np.column_stack([children,parents]).ravel(),
+                          matching_M.ravel()])
+    dst = np.concatenate([np.column_stack([parents,children]).ravel(),
+                          matching_M[:,::-1].ravel()])
+
+    order = np.argsort(src,kind='stable')
+    offsets = np.zeros(n + 1,dtype=int)
+    np.cumsum(np.bincount(src,minlength=n),out=offsets[1:])
+
+    return offsets,dst[order]
+
+
+def euler_tour_csr(offsets,targets,start_vertex=0):
+    """
+    Hierholzer's algorithm on the CSR multigraph given by build_multigraph_csr
+    the arcs are marked in a used bitmap instead of being removed from python lists.
+    It follows exactly the same choices as euler_tour: the last free arc of u is taken
+    and the first free arc v -> u is consumed with it (list.remove semantics).
+    The parallel arcs u -> v are consumed from the front (remove) or from the back (pop)
+    so the free arcs of a group are always a range starting at its 'lo' pointer.
+    param:
+        offsets, targets: CSR multigraph
+        start_vertex: the vertex at which we start (and finish)
+    return:
+        euler tour with potentially a cycle
+    """
+    n = len(offsets) - 1
+    m = len(targets)
+    if m == 0:
+        return [start_vertex]
+
+    sources = np.repeat(np.arange(n),np.diff(offsets))
+
+    # group the parallel arcs u -> v, the positions of a group stay sorted (stable sort)
+    keys = sources * n + targets
+    members = np.argsort(keys,kind='stable')
+    sorted_keys = keys[members]
+    starts = np.flatnonzero(np.r_[True,sorted_keys[1:] != sorted_keys[:-1]])
+    twin_of = np.searchsorted(sorted_keys[starts],targets * n + sources)
+
+    # python lists are faster than numpy scalars in the sequential loop
+    targets_l = targets.tolist()
+    offsets_l = offsets.tolist()
+    members_l = members.tolist()
+    twin_of_l = twin_of.tolist()
+    group_lo = starts.tolist() # first free arc of each group
+
+    ptr = offsets_l[1:] # the free arcs of u are in [offsets[u], ptr[u])
+    used = bytearray(m)
+
+    tour = []
+    stack = [start_vertex]
+
+    while stack:
+        u = stack[-1]
+
+        p = ptr[u]
+        first = offsets_l[u]
+        while p > first and used[p - 1]:
+            p -= 1
+
+        if p > first:
+            p -= 1
+            used[p] = 1
+            ptr[u] = p
+
+            # list_adj[v].remove(u): first free arc v -> u
+            t = twin_of_l[p]
+            used[members_l[group_lo[t]]] = 1
+            group_lo[t] += 1
+
+            stack.append(targets_l[p])
+        else:
+            ptr[u] = p
+            tour.append(stack.pop())
+
+    return tour[::-1]
+
+
+def shortcut_tour(tour,n):
+    """
+    same as remove_repeated_vertices_euleur in O(len(tour)) using a boolean seen-array
+    param:
+        tour: the tour founded by the euleur algo
+        n: number of vertices
+    return:
+        same tour with removed repeated vertices
+    """
+    seen = bytearray(n)
+    res = []
+    for v in tour[:-1]:
+        if not seen[v]:
+            seen[v] = 1
+            res.append(v)
+    res.append(tour[-1])
+    return res
+
+
+def apply_christophides(arbre,matching="blossom",k=10,start_vertex=0,tracer=None):
     """
     application of the christophides algorithme 
     param:
         arbre: 2D numpy array where the index (i,j) represent the weight of the edge (i,j) source i -  dest j 
+        matching: the method of minimum_weight_matching ("blossom", "greedy" or "knn")
+        k: number of candidate neighbours for the "knn" matching
+        start_vertex: the vertex at which the tour starts and ends
+        tracer: optional instrumentation.Tracer, gets the time of each stage, the matching size and the tour length
 
     return the christophides output,e.g [0,1,4,3,2,0] means we should start at 0 go to 1,4,3,2 then finish at 0 
     """
     # https://en.wikipedia.org/wiki/Christofides_algorithm
+    tracer = get_tracer(tracer)
 
-    acpm_graph = ACPM(arbre,s=0)
+    with tracer.stage("ACPM"):
+        acpm_graph = ACPM(arbre,s=start_vertex)
     
-    odd_vertices = compute_impair_vertices(acpm_graph)
+    with tracer.stage("compute_impair_vertices"):
+        odd_vertices = compute_impair_vertices(acpm_graph)
     
-    minimum_matching_vertices = minimum_weight_matching(arbre,odd_vertices)
+    with tracer.stage("minimum_weight_matching"):
+        minimum_matching_vertices = minimum_weight_matching(arbre,odd_vertices,method=matching,k=k)
 
-    acpm_union_min_vertices = unite_matching_acpm(minimum_matching_vertices,acpm_graph,arbre)
+    with tracer.stage("euler_tour"):
+        offsets,targets = build_multigraph_csr(minimum_matching_vertices,acpm_graph,len(arbre))
 
-    tour = euler_tour(acpm_union_min_vertices,start_vertex=0)
+        tour = euler_tour_csr(offsets,targets,start_vertex=start_vertex)
 
-    tour = remove_repeated_vertices_euleur(tour)
+        tour = shortcut_tour(tour,len(arbre))
 
+    tracer.stats.set("matching_size",len(minimum_matching_vertices))
+    tracer.stats.set("tour_length",len(tour))
     return tour
 
 
-arbre = np.array([[0,1,2,1,1],
-                    [0,0,1,2,1],
-                    [0,0,0,1,1],
-                    [0,0,0,0,1],
-                    [0,0,0,0,0],
-                 ])
-
+if __name__ == "__main__":
+    # python christofides.py
+    arbre = np.array([[0,1,2,1,1],
+                        [0,0,1,2,1],
+                        [0,0,0,1,1],
+                        [0,0,0,0,1],
+                        [0,0,0,0,0],
+                     ])
 
-# test celui du td
-"""
-arbre = np.array([  [0,2,1,3,2],
-                    [0,0,1,2,3],
-                    [0,0,0,2,3],
-                    [0,0,0,0,2],
-                    [0,0,0,0,0],
-                 ])
-"""
+    # test celui du td
+    """
+    arbre = np.array([  [0,2,1,3,2],
+                        [0,0,1,2,3],
+                        [0,0,0,2,3],
+                        [0,0,0,0,2],
+                        [0,0,0,0,0],
+                     ])
+    """
 
-arbre = arbre + arbre.T # symmetric
-#print('Solution: ',apply_christophides(arbre))
+    arbre = arbre + arbre.T # symmetric
+    print('Solution: ',apply_christophides(arbre))
 
@@ -1,11 +1,11 @@
 import numpy as np
-from christofides import apply_christophides
-from utils import transform_to_matrix, get_path_in_letters,get_blockages_in_int,calculate_cost
-from scipy.sparse import csr_array
-from scipy.sparse.csgraph import dijkstra
-import sys 
-
-MAX_INT = sys.maxsize
+from tour_cache import cached_christophides
+from utils import transform_to_matrix, get_path_in_letters,calculate_cost, BLOCKED
+from blockage_index import BlockageIndex
+from instance import Instance
+from sparse_graph import DistanceRows
+from candidate_graph import PointDistances
+from instrumentation import get_tracer
 
 
 def mapp_predecessor(n,tmp_visited,predecessor):
@@ -74,23 +74,96 @@ def get_reverse_predecessor(n, original_predecessor, u_idx, v_idx):
 
     return reverse_predecessor
 
-def shortcut(graph, tsp_tour, blockages):
+class KnownGraph:
+    """
+    the known graph G*: the base weight matrix plus the set of the edges known to be blocked
+    it replaces a dense copy of the matrix where the blocked edges were set to a large value,
+    the base matrix is never copied nor modified (it keeps its compact dtype, e.g int32).
+    The copies it returns are float64 with BLOCKED (inf) on the blocked edges, a sum of weights
+    can not overflow and a path through a blocked edge costs inf
+    """
+
+    def __init__(self, graph, blocked=()):
+        """
+        param:
+            graph: 2D weight matrix
+            blocked: iterable of the blocked edges (u,v), symmetric
+        """
+        # the lazy closure of a sparse graph (or the distances of points) is read row by row, never converted to an array
+        self.graph = graph if isinstance(graph, (DistanceRows, PointDistances)) else np.asarray(graph)
+        self.blocked = set()
+        for u, v in blocked:
+            self.block(u, v)
+
+    def block(self, u, v):
+        """mark the edge u-v as blocked"""
+        self.blocked.add((min(u, v), max(u, v)))
+
+    def is_blocked(self, u, v):
+        return (min(u, v), max(u, v)) in self.blocked
+
+    def weight(self, u, v):
+        """weight of the edge u-v, BLOCKED (inf) if it is known to be blocked"""
+        if self.is_blocked(u, v):
+            return BLOCKED
+        return self.graph[u, v]
+
+    def submatrix(self, rows, cols):
+        """dense float64 copy of G*[rows, cols] with BLOCKED (inf) on the blocked edges"""
+        rows = np.asarray(rows, dtype=int)
+        cols = np.asarray(cols, dtype=int)
+        sub = np.asarray(self.graph[np.ix_(rows, cols)], dtype=np.float64)
+        if not self.blocked:
+            return sub
+
+        n = len(self.graph)
+        row_pos = np.full(n, -1)
+        row_pos[rows] = np.arange(len(rows))
+        col_pos = np.full(n, -1)
+        col_pos[cols] = np.arange(len(cols))
+
+        edges = np.array(list(self.blocked), dtype=int)
+        for a, b in ((edges[:, 0], edges[:, 1]), (edges[:, 1], edges[:, 0])):
+            keep = (row_pos[a] >= 0) & (col_pos[b] >= 0)
+            sub[row_pos[a[keep]], col_pos[b[keep]]] = BLOCKED
+        return sub
+
+    def toarray(self):
+        """dense copy of G* (what shortcut used to return)"""
+        everything = np.arange(len(self.graph))
+        return self.submatrix(everything, everything)
+
+    def __getitem__(self, u):
+        """row u of G* (a copy), G_star[u][v] is the same as G_star.weight(u,v)"""
+        return self.submatrix([u], np.arange(len(self.graph)))[0]
+
+    def __len__(self):
+        return len(self.graph)
+
+
+def shortcut(graph, tsp_tour, blockages, tracer=None):
     """
     Simulates the journey following a TSP tour and makes shortcuts when blocked edges are encountered.
+    Each time the traveller stands on a vertex he learns its blocked edges, they are read
+    from the blocked neighbours of the BlockageIndex so Eb is built in O(n + k)
     
     Args:
         graph: Weight matrix of the graph
         tsp_tour: Order of vertices in the TSP tour
-        blockages: List of blocked edges
+        blockages: BlockageIndex of the blocked edges (a list of pairs is converted)
+        tracer: optional instrumentation.Tracer, receives a "shortcut" event with P1, Eb and U
         
     Returns:
-        tuple: (G_star, U, P1) - the visited graph, unvisited vertices, and the shortcut path
+        tuple: (G_star, U, P1) - the visited graph (KnownGraph), unvisited vertices, and the shortcut path
     """
-    num_nodes = len(graph)
-    G_star = np.copy(graph)
+    if not hasattr(blockages, "neighbors"):
+        blockages = BlockageIndex.from_pairs(list(blockages), len(graph))
+    tracer = get_tracer(tracer)
+
     U = {tsp_tour[0]}
     P1 = [tsp_tour[0]]
     Eb = set()
+    learned = set() # the vertices whose blocked edges are already in Eb
 
     i = 0
     j = 1
@@ -99,13 +172,12 @@ def shortcut(graph, tsp_tour, blockages):
         vi = tsp_tour[i]
         vj = tsp_tour[j]
 
-        for x in range(num_nodes):
-            if x != vi:
-                is_blocked = [vi, x] in blockages or [x, vi] in blockages
-                if is_blocked:
-                    Eb.add(tuple(sorted((vi, x))))
+        if vi not in learned:
+            learned.add(vi)
+            for x in blockages.neighbors(vi).tolist():
+                Eb.add(tuple(sorted((vi, x))))
 
-        is_blocked = [vi, vj] in blockages or [vj, vi] in blockages
+        is_blocked = blockages.is_blocked(vi, vj)
         if not is_blocked:
             P1.append(vj)
             i = j
@@ -113,31 +185,201 @@ def shortcut(graph, tsp_tour, blockages):
             U.add(vj)
         j += 1
     # Check edge back to the starting vertex
-    is_blocked = [tsp_tour[i], tsp_tour[0]] in blockages or [tsp_tour[0], tsp_tour[i]] in blockages
+    is_blocked = blockages.is_blocked(tsp_tour[i], tsp_tour[0])
 
     if is_blocked:
         # Return using the reverse path
         return_path = P1[::-1][1:]  # Skip the repeated start vertex
         P1.extend(return_path)
 
-
-    # Update the known graph with blocked edges
-    for u, v in Eb:
-        G_star[u][v] = MAX_INT
-        G_star[v][u] = MAX_INT
+    # the known graph is the base matrix with the blocked edges on top
+    G_star = KnownGraph(graph, Eb)
     
-    print(f"Shortcut Eb: {Eb}")
+    if tracer.enabled:
+        tracer.event("shortcut", P1=list(P1), blocked=sorted(Eb), unvisited=sorted(U))
     return G_star, U, P1
 
-def compress(G_star, U):
+def unvisited_list(U, start_vertex=0):
+    """the vertices of U as a list with the start vertex first, the order of G' and of the legs of NN"""
+    return [start_vertex] + [u for u in U if u != start_vertex]
+
+def min_plus(left, right):
+    """
+    min-plus product of two matrices: C[i,j] = min_k left[i,k] + right[k,j]
+    computed row by row so the memory stays O(k * j)
+    return C and the argmin k of each entry
+    """
+    C = np.empty((left.shape[0], right.shape[1]))
+    arg = np.empty((left.shape[0], right.shape[1]), dtype=int)
+    right_T = np.ascontiguousarray(right.T) # the reduction runs along contiguous rows
+    rows = np.arange(right.shape[1])
+    for i in range(left.shape[0]):
+        tmp = right_T + left[i]
+        arg[i] = np.argmin(tmp, axis=1)
+        C[i] = tmp[rows, arg[i]]
+    return C, arg
+
+
+def compress(G_star, U, method="minplus", start_vertex=0, tracer=None):
     """
     Create multigraph G' from G* and U
     For each pair of vertices in U, find shortest path using only known edges
+    A path between u and v can only use the visited vertices (and the start vertex)
+    as intermediate vertices, so G' is given by one all-pairs shortest path on the visited
+    subgraph A followed by two min-plus products:
+        X = W[U,A] (min,+) D_A        shortest u -> b through A
+        G'[u,v] = X[u] (min,+) W[A,v]
+    it gives the same G' as the Dijkstra per pair of compress_dijkstra
+    the paths are kept in a PathStore and only rebuilt for the legs taken by nearest_neighbor
+    param:
+        G_star: KnownGraph (or matrix) after the shortcut 
+        U: the unvisited vertices, with the start vertex (G' follows the order of unvisited_list(U, start_vertex))
+        method: "minplus" (default) or "dijkstra" (one Dijkstra per pair of U)
+        start_vertex: the first vertex of the tour
+        tracer: optional instrumentation.Tracer, counts the calls to the shortest path of scipy in "dijkstra_calls"
+    """
+    if method == "dijkstra":
+        return compress_dijkstra(G_star, U, start_vertex=start_vertex, tracer=tracer)
+    if method != "minplus":
+        raise ValueError(f"Unknown compress method: {method}")
+
+    if not isinstance(G_star, KnownGraph):
+        G_star = KnownGraph(G_star)
+
+    Us = unvisited_list(U, start_vertex)
+    n = len(G_star)
+
+    in_U = np.zeros(n, dtype=bool)
+    in_U[Us] = True
+    A = np.flatnonzero(~in_U | (np.arange(n) == start_vertex)) # visited vertices + the start vertex
+    Us_arr = np.array(Us, dtype=int)
+
+    from scipy.sparse.csgraph import shortest_path # imported here, slow to import
+    D_A, pred_A = shortest_path(_known_weights(G_star, A, A), directed=False, return_predecessors=True)
+    get_tracer(tracer).count("dijkstra_calls")
+
+    # X[i,b] shortest path from Us[i] to A[b] using only A, the start vertex is already in A
+    X, X_arg = min_plus(_known_weights(G_star, Us_arr, A), D_A)
+    start = np.flatnonzero(Us_arr == start_vertex)
+    if len(start):
+        local_start = np.searchsorted(A, start_vertex)
+        X[start] = D_A[local_start]
+        X_arg[start] = local_start
+
+    # G'[i,j] shortest path from Us[i] to Us[j] with all intermediate vertices in A, inf if there is none
+    G_prime, G_arg = min_plus(X, _known_weights(G_star, A, Us_arr))
+
+    paths = PathStore(Us, A, X_arg, G_arg, pred_A, np.isfinite(G_prime))
+
+    G_prime = np.triu(G_prime, 1)
+    G_prime = G_prime + G_prime.T
+
+    return G_prime, paths
+
+
+def _known_weights(G_star, rows, cols):
+    """
+    float submatrix of the KnownGraph with the same edges as the csr_array of compress_dijkstra:
+    a weight of 0 between two different vertices is not an edge
+    """
+    W = G_star.submatrix(rows, cols)
+    W[W == 0] = np.inf
+    W[rows[:, None] == cols[None, :]] = 0
+    return W
+
+
+class PathStore:
+    """
+    compact store of the shortest paths found by compress, instead of two predecessor
+    arrays of size n for every pair of U the paths are rebuilt lazily when nearest_neighbor
+    takes a leg, from:
+        pred_A: predecessor matrix of the all-pairs shortest path on the visited vertices A
+        X_arg[i,b]: first vertex of A on the shortest path from Us[i] to A[b]
+        G_arg[i,j]: last vertex of A on the shortest path from Us[i] to Us[j]
+    the memory is O(|A|^2 + |U| |A| + |U|^2) instead of O(|U|^2 n)
+    """
+
+    def __init__(self, Us, A, X_arg, G_arg, pred_A, reachable):
+        self.Us = np.asarray(Us, dtype=np.int32)
+        self.A = np.asarray(A, dtype=np.int32)
+        self.X_arg = X_arg.astype(np.int32)
+        self.G_arg = G_arg.astype(np.int32)
+        self.pred_A = pred_A.astype(np.int32)
+        self.reachable = reachable
+        self.index = {u: i for i, u in enumerate(Us)}
+
+    def path(self, source, dest):
+        """
+        the path from source to dest (both in U), without source, e.g A-B-C-D-E gives [B,C,D,E]
+        same as retrieve_path_from_pred(source,dest,total_predecessors[source,dest])
+        """
+        i = self.index[source]
+        j = self.index[dest]
+        if i < j:
+            return self._forward(i, j)
+        # the paths are stored for i < j, the other direction is the same path reversed
+        full = [int(self.Us[j])] + self._forward(j, i)
+        return full[::-1][1:]
+
+    def _forward(self, i, j):
+        """Us[i] -> A[a] -> ... -> A[b] -> Us[j], without Us[i]"""
+        dest = int(self.Us[j])
+        if not self.reachable[i, j]:
+            return []
+
+        b = self.G_arg[i, j]
+        a = self.X_arg[i, b]
+        inner = [int(self.A[b])]
+        while b != a:
+            b = self.pred_A[a, b]
+            inner.append(int(self.A[b]))
+        inner = inner[::-1]
+
+        if inner[0] == self.Us[i]:
+            inner = inner[1:] # the start vertex is the source itself
+        return inner + [dest]
+
+    @property
+    def nbytes(self):
+        """memory footprint of the store in bytes (without the python dict of positions)"""
+        return sum(arr.nbytes for arr in (self.Us, self.A, self.X_arg, self.G_arg,
+                                          self.pred_A, self.reachable))
+
+    def __repr__(self):
+        return f"PathStore(|U|={len(self.Us)}, |A|={len(self.A)}, nbytes={self.nbytes})"
+
+
+def leg_path(predecessor, source, dest):
+    """
+    the path of a leg of nearest_neighbor, without source
+    param:
+        predecessor: PathStore (compress), or any object with a path(source,dest) method,
+        or dict of predecessor arrays (compress_dijkstra)
+    """
+    if hasattr(predecessor, "path"):
+        return predecessor.path(source, dest)
+    return retrieve_path_from_pred(source, dest, predecessor[source, dest])
+
+
+def compress_dijkstra(G_star, U, start_vertex=0, tracer=None):
+    """
+    Create multigraph G' from G* and U
+    For each pair of vertices in U, find shortest path using only known edges
+    original implementation with one Dijkstra on a mini-graph for each pair of U
     param:
         G_star: modified matrice after the shortcut 
-        U: the list of unvisited vertices
+        U: the unvisited vertices, with the start vertex
+        start_vertex: the first vertex of the tour
+        tracer: optional instrumentation.Tracer
     """
-    Us = list(U)  
+    from scipy.sparse import csr_array
+    from scipy.sparse.csgraph import dijkstra
+
+    tracer = get_tracer(tracer)
+    if isinstance(G_star, KnownGraph):
+        G_star = G_star.toarray()
+
+    Us = unvisited_list(U, start_vertex)
     n = len(G_star)
     G_prime = [[0] * len(Us) for _ in range(len(Us))]
 
@@ -152,7 +394,7 @@ def compress(G_star, U):
 
             tmp_visited = visited_vertices + [v] 
             tmp_visited += [u]
-            if i != 0: tmp_visited += [0]
+            if i != 0: tmp_visited += [start_vertex]
 
             tmp_visited = list(sorted(tmp_visited)) # TRES IMPORTANT pour garder les poids dand l'ordre 
 
@@ -165,24 +407,29 @@ def compress(G_star, U):
             on veut faire le plus court chemin en utilisant seulement les sommets visité 
             quand on va donner le graph a djistra si on ne met pas la valeur de la distance 
             entre u et v a MAX alors il se peut qu'il utilise ce chemin OR u et v ne sont pas visité 
-            donc pour être SUR qu'il ne passe pas de u à v directement on va mettre la distance a MAX et donc il va 
+            donc pour être SUR qu'il ne passe pas de u à v directement on va mettre la distance a BLOCKED (inf) et donc il va 
             aller chercher un chemin dont tout les sommets sont visité 
-            et ces le cas seulement quand i est != 0 car le premier indices et 0 et on peut passer de 0 and v directement
+            et ces le cas seulement quand i est != 0 car Us[0] est le sommet de départ et on peut passer de celui-ci a v directement
             ce n'est pas un soucis
             """
             if i != 0:    
-                mini_graph[ind_v][ind_u] = MAX_INT
-                mini_graph[ind_u][ind_v] = MAX_INT
+                mini_graph[ind_v][ind_u] = BLOCKED
+                mini_graph[ind_u][ind_v] = BLOCKED
 
             dist_matrix, predecessor = dijkstra(csgraph=csr_array(mini_graph), 
                                                 directed=False, 
                                                 indices=ind_u, 
                                                 return_predecessors=True)
+            tracer.count("dijkstra_calls")
             
             mapped_original_index = mapp_predecessor(n,tmp_visited,predecessor)
             
             total_predecessors[u,v] = mapped_original_index
-            total_predecessors[v,u] = get_reverse_predecessor(n,mapped_original_index,u,v)
+            if np.isfinite(dist_matrix[ind_v]):
+                total_predecessors[v,u] = get_reverse_predecessor(n,mapped_original_index,u,v)
+            else:
+                # pas de chemin (G' infini), nearest_neighbor ne prendra jamais cette arête
+                total_predecessors[v,u] = np.full(n, -1, dtype=int)
             
             G_prime[i][j] = dist_matrix[ ind_v ]
             G_prime[j][i] = dist_matrix[  ind_v ]
@@ -190,124 +437,210 @@ def compress(G_star, U):
     return G_prime,total_predecessors
 
 
-def nearest_neighbor(G_star,G_prime,blockages,predecessor,U):
+class LegCosts:
+    """
+    costs of the legs of nearest_neighbor between the vertices of U, it is the multigraph G' of the paper:
+    the next vertex is chosen on G' (the paths of compress through the visited vertices), the leg taken
+    is the direct edge u-v when it is open and not more expensive.
+    The paths of compress only use edges with a visited end, their state is known before NN starts,
+    so a blocked edge found by NN (between two vertices of U) can not change G' nor the PathStore:
+    it only removes the direct leg u-v. The repair is O(1) per blocked edge found, the direct legs
+    of u are read when the traveller stands on u (all the edges of u are known then).
+    """
+
+    def __init__(self, G_star, G_prime, paths, U):
+        """
+        param:
+            G_star: KnownGraph, the blocked edges found are added to it
+            G_prime, paths: the output of compress (or compress_dijkstra)
+            U: the list of unvisited vertices, U[0] is the start vertex
+        """
+        self.G_star = G_star
+        self.G_prime = np.asarray(G_prime, dtype=float)
+        self.paths = paths
+        self.U = np.asarray(list(U), dtype=int)
+        self.position = {int(u): i for i, u in enumerate(self.U)}
+
+    def row(self, i, blocked):
+        """
+        costs of the direct legs from U[i] to every vertex of U (inf when blocked), the blocked edges of U[i]
+        are added to G_star
+        """
+        u = int(self.U[i])
+        direct = np.asarray(self.G_star.graph[u], dtype=float)[self.U]
+        direct[i] = np.inf
+        for x in np.asarray(blocked).tolist():
+            j = self.position.get(x)
+            if j is not None:
+                direct[j] = np.inf
+                self.G_star.block(u, x)
+        return direct
+
+    def cost(self, i, j, direct):
+        """cost of the leg U[i] -> U[j], inf if the direct edge is blocked and compress found no path"""
+        return min(self.G_prime[i][j], direct[j])
+
+    def path(self, i, j, direct):
+        """the leg U[i] -> U[j] without U[i], the direct edge when it is not more expensive"""
+        if direct[j] <= self.G_prime[i][j]:
+            return [int(self.U[j])]
+        return leg_path(self.paths, int(self.U[i]), int(self.U[j]))
+
+
+def nearest_neighbor(G_star,G_prime,blockages,predecessor,U,method="vectorized",start_vertex=0,tracer=None):
     """
-    NN algorithm 
+    NN algorithm on the multigraph G' (LegCosts): at each vertex of U the traveller learns its blocked
+    edges and goes to the nearest unvisited vertex in G', by the direct edge if it is open and not more
+    expensive, by the path found by compress otherwise
     param:
-        G_star: modified matrice after the shortcut 
+        G_star: KnownGraph after the shortcut, the blocked edges found are added to it
         G_prime: a list that contains the cost for each of the unvisited vertices 
-        blockages: list that represent the blockages 
-        predecessor: a list that contains the predecessor for a given path 
+        blockages: BlockageIndex (or list) that represent the blockages 
+        predecessor: the PathStore of compress (or the predecessors of compress_dijkstra) that gives the path of a leg
         for example maybe to go to the vertice C from A we just take the vertice B and D (found in Djisktra) 
-        U: the list of unvisited vertices
+        U: the unvisited vertices, with the start vertex (same as for compress)
+        method: "vectorized" (default) picks the next vertex with one masked argmin,
+        "loop" scans G_prime[current] in python, both give the same path
+        start_vertex: the first vertex of the tour, NN starts and ends there
+        tracer: optional instrumentation.Tracer, receives a "leg" event for each vertex of U reached
     """
-    G_prime = np.array(G_prime)
-    n = len(G_prime)
-    visited = [False] * n
-    path = [] # we don't include the 0 we don't need 
+    if method not in ("vectorized", "loop"):
+        raise ValueError(f"Unknown nearest_neighbor method: {method}")
+    tracer = get_tracer(tracer)
+
+    if not isinstance(G_star, KnownGraph):
+        G_star = KnownGraph(G_star)
+    if not hasattr(blockages, "neighbors"):
+        blockages = BlockageIndex.from_pairs(list(blockages), len(G_star))
+
+    legs = LegCosts(G_star, G_prime, predecessor, unvisited_list(U, start_vertex))
+    n = len(legs.U)
+    visited = np.zeros(n, dtype=bool)
+    path = [] # we don't include the start vertex we don't need 
     visited[0] = True
+    nb_visited = 1
     current = 0
-    U = list(U) # {0, 2, 3} we skip the first one it is visited
-    
-    while sum(visited) != n:
-        min_dist = float('inf')
-
-        for i in range(n):
-            if G_prime[current][i] < min_dist and visited[i] == False:
-                min_index = i
-                min_dist = G_prime[current][i]
-
-        # we have to compare with the direct distance from current to the min_index 
-        direct_dist = G_star[U[current]][U[min_index]]
-        cost = min_dist
-        taken_path = []
-        
-        if [U[current],U[min_index]] in blockages:
-            G_star[U[current]][U[min_index]] = MAX_INT
-            G_star[U[min_index]][U[current]] = MAX_INT
-            # si il y a un blockages alors forcement on va utiliser le chemin donner par le compress
-            # car celui ci passe par des chemin déjà visité ces garantie
-            taken_path = retrieve_path_from_pred(U[current],U[min_index],predecessor[U[current],U[min_index]])
-        else:
-            # il y a pas de blockage et le chemin directe et mieux que celui trouvé dans compress
-            if min_dist >= direct_dist:
-                # we don't use the shortest path 
-                cost = direct_dist
-                taken_path = [U[min_index]]
-            else:
-                # ceci ne dois pas être possible car INEGALITE TRIANGULAIRE
-                # il y a pas de blockages mais ce chemin et mieux que le chemin actuel
-                taken_path = retrieve_path_from_pred(U[current],U[min_index],predecessor[U[current],U[min_index]]) 
-                
 
-        # le plus cours chemin + le chemin direct est bloqué 
+    while nb_visited != n:
+        # the traveller stands on U[current], he knows its blocked edges
+        direct = legs.row(current, blockages.neighbors(legs.U[current]))
+        G_row = legs.G_prime[current]
+        if method == "vectorized":
+            # first unvisited vertex of minimal cost, same as the strict '<' of the loop
+            min_index = int(np.argmin(np.where(visited, np.inf, G_row)))
+            if visited[min_index]:
+                min_index = int(np.argmin(visited)) # every unvisited vertex has G' = inf
+        else:
+            min_index = int(np.argmin(visited)) # first unvisited, kept if they all have G' = inf
+            min_dist = float('inf')
+            for i in range(n):
+                if G_row[i] < min_dist and visited[i] == False:
+                    min_index = i
+                    min_dist = G_row[i]
+        cost = legs.cost(current, min_index, direct)
+
+        # le chemin direct et le plus court chemin sont bloqués (coût infini)
         # on stop l'algortihme il faut au moins un chemin vers ce sommet 
-        if cost == MAX_INT:
-            raise Exception(f"Aucun chemin a été trouvé pour accéder le sommet {U[min_dist]} depuis {U[current]} ")
-        
+        if not np.isfinite(cost):
+            raise Exception(f"Aucun chemin a été trouvé pour accéder le sommet {legs.U[min_index]} depuis {legs.U[current]} ")
+
+        taken_path = legs.path(current, min_index, direct)
         path.extend(taken_path)
+        tracer.count("legs")
+        if tracer.enabled:
+            tracer.event("leg", source=int(legs.U[current]), dest=int(legs.U[min_index]), cost=float(cost), path=list(taken_path))
         visited[min_index] = True
+        nb_visited += 1
         current = min_index
 
-    if G_prime[current][0] == MAX_INT: # Blockage 
-        # on retourne en arriere comme dans shortcut
-        return_path = path[::-1][1:]  
+    if not np.isfinite(legs.G_prime[current][0]): # Blockage 
+        # on retourne en arriere comme dans shortcut, path ne contient pas le sommet de départ
+        return_path = path[::-1][1:] + [int(legs.U[0])]
         path.extend(return_path)
     else:
-        path.extend(retrieve_path_from_pred(source_ind=U[current],dest_ind=0,predecessor=predecessor[U[current],0]))
+        path.extend(leg_path(predecessor,int(legs.U[current]),start_vertex))
 
     return path
 
-def apply_cnn_to_routes(routes, blockages=None):
+def apply_cnn(matrix, blockages, tsp_tour=None, tracer=None):
     """
-    Apply the CNN algorithm to the TSP problem
-    CNN combines:
-    1. Christofides' algorithm to create an initial tour
-    2. Handling blockages by following the tour order
-    3. Handling unvisited vertices by creating the multigraph G'
+    CNN on the vertex indices
+    param:
+        matrix: 2D numpy array of the weights
+        blockages: BlockageIndex of the blocked edges (vertex indices)
+        tsp_tour: the christofides tour, computed (with the tour cache) if not given
+        tracer: optional instrumentation.Tracer, gets the events and the stats of every stage
+    return the path in index
     """
-    if blockages is None:
-        blockages = []
-        
-    matrix = transform_to_matrix(routes)
-    
-    # Get initial TSP tour using Christofides
-    christophides_path = apply_christophides(matrix)
-    blockages = get_blockages_in_int(blockages,routes)
-    
+    tracer = get_tracer(tracer)
+    blockages = tracer.watch(blockages)
+
+    if tsp_tour is None:
+        # Get initial TSP tour using Christofides
+        with tracer.stage("christofides"):
+            tsp_tour = cached_christophides(matrix, tracer=tracer)
+    tracer.stats.set("tour_length", len(tsp_tour))
+
     # Create shortcut path
-    G_star, U, P1 = shortcut(matrix, christophides_path, blockages)
+    with tracer.stage("shortcut"):
+        G_star, U, P1 = shortcut(matrix, tsp_tour, blockages, tracer=tracer)
     
     P2 = []
     # Create compressed graph G'
     if len(U) > 1: # some vertices hasn't been visited
-        G_prime,pred = compress(G_star, U)
-        P2 = nearest_neighbor(G_star,G_prime,blockages,pred,U)
-    
+        with tracer.stage("compress"):
+            G_prime,pred = compress(G_star, U, start_vertex=tsp_tour[0], tracer=tracer)
+        with tracer.stage("nearest_neighbor"):
+            P2 = nearest_neighbor(G_star,G_prime,blockages,pred,U,start_vertex=tsp_tour[0],tracer=tracer)
     
-    print(f'P1: {P1}')
-    print(f'P2: {P2}')
+    tracer.stats.set("unvisited", len(U) - 1)
+    if tracer.enabled:
+        tracer.event("cnn_path", P1=list(P1), P2=list(P2))
     final_path = P1 + P2
     return final_path
 
-"""
-routes = {
-        'A': {'A':0, 'B': 1, 'C':2,'D': 1,'E':1},
-        'B': {'A': 1, 'B':0, 'C':1, 'D': 4, 'E': 1},
-        'C': {'A': 2, 'B':1, 'C':0, 'D': 1, 'E': 1},
-        'D': {'A': 1, 'B':4, 'C':1, 'D': 0, 'E': 1},
-        'E': {'A': 1, 'B':1, 'C':1, 'D': 1, 'E': 0},
-    }
-
-blockages = [
-    ["D", "E"],["E","C"]
-]
-    
-final_path = apply_cnn_to_routes(routes, blockages)
-    
-f = get_path_in_letters(solution=final_path,base_tuple=routes)
-print(f"Final Path: {f}")
-print(f"Cost: {calculate_cost(f,routes)}")
+def apply_cnn_to_routes(routes, blockages=None, tracer=None, improve=None):
+    """
+    Apply the CNN algorithm to the TSP problem
+    CNN combines:
+    1. Christofides' algorithm to create an initial tour
+    2. Handling blockages by following the tour order
+    3. Handling unvisited vertices by creating the multigraph G'
+    routes: dict of the routes (blockages given with the labels) or an Instance (blockages is not used)
+    tracer: optional instrumentation.Tracer, see apply_cnn
+    improve: optional local search of the christofides tour, see Instance.tour
+    return the path in index: a list for a routes dict, a 1D int64 array for an Instance,
+    expanded into real edges for a non complete graph
+    """
+    tracer = get_tracer(tracer)
+    instance = routes if isinstance(routes, Instance) else Instance.from_routes(routes, blockages)
+    with tracer.stage("christofides"):
+        tour = instance.tour(tracer=tracer, improve=improve)
+    # real edges for a sparse graph
+    path = instance.expand(apply_cnn(instance.matrix, instance.blockages, tour, tracer=tracer))
+
+    if isinstance(routes, Instance):
+        return np.asarray(path, dtype=np.int64)
+    return path
+
+if __name__ == "__main__":
+    # Example usage: python cnn_algorithm.py
+    routes = {
+            'A': {'A':0, 'B': 1, 'C':2,'D': 1,'E':1},
+            'B': {'A': 1, 'B':0, 'C':1, 'D': 4, 'E': 1},
+            'C': {'A': 2, 'B':1, 'C':0, 'D': 1, 'E': 1},
+            'D': {'A': 1, 'B':4, 'C':1, 'D': 0, 'E': 1},
+            'E': {'A': 1, 'B':1, 'C':1, 'D': 1, 'E': 0},
+        }
+
+    blockages = [
+        ["D", "E"],["E","C"]
+    ]
+
+    final_path = apply_cnn_to_routes(routes, blockages)
+
+    f = get_path_in_letters(solution=final_path,base_tuple=routes)
+    print(f"Final Path: {f}")
+    print(f"Cost: {calculate_cost(f,routes)}")
 
-"""
 
@@ -1,35 +1,116 @@
+"""
+Comparison of CR and CNN on random graphs, the trials are spread over a process pool.
+
+Every trial gets its own seed spawned from the master seed (numpy SeedSequence), so a trial
+only depends on (master seed, trial index): the results are the same whatever the number of workers.
+Only the costs and the seed of each trial are sent back, an instance where CNN is better than CR
+can be rebuilt with construct_alea_graph(rng=random.Random(seed)).
+
+run from the root of the project:
+    python comparison.py
+    python comparison.py --trials 1000 --workers 8 --seed 42
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
 from routage_cyclique import apply_routage_cyclique
 from cnn_algorithm import apply_cnn_to_routes
 from utils import construct_alea_graph,get_path_in_letters,calculate_cost
+from tour_cache import DEFAULT_CACHE
 
-def main():
 
-    CR = []
-    CNN = []
-    routess = []
-    blockagess = []
-    print("Comparison Launched...")
-    for _ in range(200):
-        routes,blockages = construct_alea_graph()
-        
+def trial_seeds(master_seed, nb_trials):
+    """one independent 64 bits seed per trial, spawned from the master seed"""
+    children = np.random.SeedSequence(master_seed).spawn(nb_trials)
+    return [int(child.generate_state(1, dtype=np.uint64)[0]) for child in children]
+
+
+def run_trial(index, seed, nb_vertices=None, nb_blockages=None):
+    """
+    build the random instance of the trial and run CR and CNN on it
+    return a small dict (the instance itself is not sent back to the parent process)
+    """
+    routes,blockages = construct_alea_graph(nb_vertices,nb_blockages,rng=random.Random(seed))
+    result = {"index": index, "seed": seed, "n": len(routes), "CR": None, "CNN": None, "error": None}
+
+    try:
         CR_PATH = apply_routage_cyclique(routes,blockages)
+        result["CR"] = calculate_cost(CR_PATH,routes)
 
         tmp = apply_cnn_to_routes(routes, blockages)
         CNN_PATH = get_path_in_letters(solution=tmp,base_tuple=routes)
-        
-        cost_CNN = calculate_cost(CNN_PATH,routes)
-        cost_CR = calculate_cost(CR_PATH,routes)
-        
-        if cost_CNN < cost_CR:
-            routess.append(routes)
-            blockagess.append(blockages)
-        
-        CR.append(cost_CR)
-        CNN.append(cost_CNN)
-
-    print("How many times CNN was better than CR: ",len(routess))
-
-    #print("Average cost of CR: ",sum(CR)/len(CR))
-    #print("Average cost of CNN: ",sum(CNN)/len(CNN))
-
-main()
\ No newline at end of file
+        result["CNN"] = calculate_cost(CNN_PATH,routes)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+def run_comparison(nb_trials=200, workers=None, master_seed=0, nb_vertices=None, nb_blockages=None):
+    """
+    run the trials on a pool of workers and yield the result of each trial as soon as it is done
+    param:
+        nb_trials: number of random instances
+        workers: number of processes, os.cpu_count() by default, 1 runs in the current process
+        master_seed: seed from which the seed of every trial is spawned
+    """
+    seeds = trial_seeds(master_seed, nb_trials)
+
+    if workers == 1:
+        for index, seed in enumerate(seeds):
+            yield run_trial(index, seed, nb_vertices, nb_blockages)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_trial, index, seed, nb_vertices, nb_blockages)
+                   for index, seed in enumerate(seeds)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="comparison of CR and CNN on random graphs")
+    parser.add_argument("--trials", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of processes, all the cores by default")
+    parser.add_argument("--seed", type=int, default=0, help="master seed")
+    parser.add_argument("--vertices", type=int, default=None,
+                        help="number of vertices, random between 50 and 100 by default")
+    parser.add_argument("--blockages", type=int, default=None,
+                        help="number of blockages, 10 * n by default")
+    parser.add_argument("--verbose", action="store_true", help="print every trial when it is done")
+    args = parser.parse_args()
+
+    print("Comparison Launched...")
+    start = time.perf_counter()
+    results = [None] * args.trials
+    for done, result in enumerate(run_comparison(args.trials, args.workers, args.seed,
+                                                 args.vertices, args.blockages), start=1):
+        results[result["index"]] = result
+        if args.verbose:
+            print(f"[{done}/{args.trials}] trial {result['index']} n={result['n']} "
+                  f"CR={result['CR']} CNN={result['CNN']}" + (f" {result['error']}" if result["error"] else ""))
+
+    # the summary is computed in trial order so it does not depend on the completion order
+    ok = [r for r in results if r["error"] is None]
+    better = [r for r in ok if r["CNN"] < r["CR"]]
+    errors = [r for r in results if r["error"] is not None]
+
+    print("How many times CNN was better than CR: ",len(better))
+    print("Average cost of CR: ",sum(r["CR"] for r in ok)/max(len(ok),1))
+    print("Average cost of CNN: ",sum(r["CNN"] for r in ok)/max(len(ok),1))
+    if better:
+        print("Seeds of the trials where CNN is better: ",[r["seed"] for r in better])
+    if errors:
+        print("Failed trials: ",[(r["index"], r["error"]) for r in errors])
+    if args.workers == 1:
+        print("Christofides tour cache: ",DEFAULT_CACHE)
+    print(f"{args.trials} trials in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
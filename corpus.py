@@ -0,0 +1,246 @@
+"""
+On-disk corpus of instances: many instances (n x n int32 distance matrix, blocked pairs, metadata)
+in a single file that can be shared between runs and machines.
+
+Layout of the file (little endian):
+    header   : MAGIC (8 bytes) + version (uint32) + padding to ALIGN
+    instances: for each instance the matrix (n*n int32) then the pairs (k*2 int32),
+               every array starts on a multiple of ALIGN bytes
+    index    : JSON list, one entry per instance {"n", "k", "matrix", "pairs", "meta"}
+               (offsets in bytes of the arrays)
+    footer   : offset of the index (uint64) + length of the index (uint64) + MAGIC
+
+The instances are written one after the other (CorpusWriter.add) and the index is only written
+at the end (close), so a corpus can be bigger than the RAM. The arrays are read with np.memmap,
+opening the instance #i does not read the others.
+
+run from the root of the project:
+    python corpus.py generate instances.corpus --instances 100 --vertices 1000 --seed 0
+    python corpus.py info instances.corpus
+"""
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"VCCORPUS"
+VERSION = 1
+ALIGN = 64
+HEADER = struct.Struct("<8sI")
+FOOTER = struct.Struct("<QQ8s")
+DTYPE = np.dtype("<i4")
+
+# rows of the matrix converted and written at once
+ROWS_PER_WRITE = 1024
+
+
+class CorpusWriter:
+    """
+    streaming writer of a corpus file, to be used as a context manager:
+        with CorpusWriter("instances.corpus") as writer:
+            writer.add(matrix, pairs, seed=0)
+    """
+
+    def __init__(self, path, append=False):
+        """
+        param:
+            path: file of the corpus
+            append: add instances at the end of an existing corpus instead of overwriting it
+        """
+        self.path = path
+        self.index = []
+        if append and os.path.exists(path):
+            reader = CorpusReader(path)
+            self.index = list(reader.index)
+            end = reader.index_offset
+            self._file = open(path, "r+b")
+            self._file.truncate(end)  # the old index is rewritten at close
+            self._file.seek(end)
+        else:
+            self._file = open(path, "wb")
+            self._file.write(HEADER.pack(MAGIC, VERSION))
+            self._pad()
+
+    def _pad(self):
+        position = self._file.tell()
+        if position % ALIGN:
+            self._file.write(b"\0" * (ALIGN - position % ALIGN))
+
+    def _write_array(self, array):
+        """write a 2D array as int32 by blocks of rows, return its offset"""
+        self._pad()
+        offset = self._file.tell()
+        for start in range(0, len(array), ROWS_PER_WRITE):
+            block = np.asarray(array[start:start + ROWS_PER_WRITE])
+            if block.size and (block.min() < np.iinfo(DTYPE).min or block.max() > np.iinfo(DTYPE).max):
+                raise ValueError("The values of the instance do not fit in int32")
+            self._file.write(np.ascontiguousarray(block, dtype=DTYPE).tobytes())
+        return offset
+
+    def add(self, matrix, pairs, **meta):
+        """
+        write an instance at the end of the corpus
+        param:
+            matrix: n x n distance matrix (any integer array, can be a memmap)
+            pairs: (k,2) blocked pairs as vertex indices
+            meta: JSON serializable metadata of the instance e.g seed=3
+        return the index of the instance in the corpus
+        """
+        if self._file is None:
+            raise ValueError("The corpus writer is closed")
+        n = len(matrix)
+        if np.shape(matrix) != (n, n):
+            raise ValueError(f"The matrix must be square, got shape {np.shape(matrix)}")
+        pairs = np.asarray(pairs).reshape(-1, 2)
+
+        entry = {"n": n, "k": len(pairs), "matrix": self._write_array(matrix),
+                 "pairs": self._write_array(pairs), "meta": meta}
+        self.index.append(entry)
+        return len(self.index) - 1
+
+    def close(self):
+        """write the index and the footer, the corpus can only be read after that"""
+        if self._file is None:
+            return
+        self._pad()
+        offset = self._file.tell()
+        data = json.dumps(self.index).encode()
+        self._file.write(data)
+        self._file.write(FOOTER.pack(offset, len(data), MAGIC))
+        self._file.close()
+        self._file = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CorpusReader:
+    """
+    read only access to a corpus file, the arrays are np.memmap views of the file (no copy)
+        reader = CorpusReader("instances.corpus")
+        matrix, pairs, meta = reader[3]
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a corpus file")
+            version = HEADER.unpack(header)[1]
+            if version != VERSION:
+                raise ValueError(f"Unsupported corpus version: {version}")
+
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(size - FOOTER.size, 0))
+            footer = f.read(FOOTER.size)
+            if len(footer) < FOOTER.size or footer[-len(MAGIC):] != MAGIC:
+                raise ValueError(f"{path} has no index, the writer has not been closed")
+            offset, length, _ = FOOTER.unpack(footer)
+            f.seek(offset)
+            self.index = json.loads(f.read(length))
+        self.index_offset = offset
+
+    def matrix(self, i):
+        """n x n int32 memmap of the distance matrix of the instance i"""
+        entry = self.index[i]
+        if entry["n"] == 0:
+            return np.empty((0, 0), dtype=DTYPE)
+        return np.memmap(self.path, dtype=DTYPE, mode="r", offset=entry["matrix"],
+                         shape=(entry["n"], entry["n"]))
+
+    def pairs(self, i):
+        """(k,2) int32 array of the blocked pairs of the instance i"""
+        entry = self.index[i]
+        if entry["k"] == 0:
+            return np.empty((0, 2), dtype=DTYPE)
+        return np.memmap(self.path, dtype=DTYPE, mode="r", offset=entry["pairs"],
+                         shape=(entry["k"], 2))
+
+    def meta(self, i):
+        return self.index[i]["meta"]
+
+    def routes(self, i):
+        """
+        the instance i in the form used by apply_routage_cyclique and apply_cnn_to_routes
+        return the routes dict and the blockages with the labels "V{i}"
+        """
+        matrix = self.matrix(i)
+        labels = [f"V{v}" for v in range(len(matrix))]
+        graph = {labels[v]: dict(zip(labels, row)) for v, row in enumerate(np.asarray(matrix).tolist())}
+        blockages = [[labels[a], labels[b]] for a, b in self.pairs(i).tolist()]
+        return graph, blockages
+
+    def instance(self, i):
+        """the instance i as an Instance on the memmap (no copy of the matrix)"""
+        from instance import Instance
+        return Instance(self.matrix(i), self.pairs(i))
+
+    def __getitem__(self, i):
+        return self.matrix(i), self.pairs(i), self.meta(i)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return f"CorpusReader({self.path!r}, instances={len(self)})"
+
+
+def generate_corpus(path, nb_instances, master_seed=0, nb_vertices=None, nb_blockages=None, append=False):
+    """
+    write nb_instances random instances of construct_alea_instance, the instance i is built
+    from the i-th seed spawned from master_seed (stored in its metadata)
+    """
+    from utils import construct_alea_instance
+
+    children = np.random.SeedSequence(master_seed).spawn(nb_instances)
+    with CorpusWriter(path, append=append) as writer:
+        for child in children:
+            seed = int(child.generate_state(1, dtype=np.uint64)[0])
+            matrix, pairs = construct_alea_instance(nb_vertices, nb_blockages, rng=seed, as_matrix=True)
+            writer.add(matrix, pairs, seed=seed, master_seed=master_seed)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="instance corpus")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write random instances")
+    generate.add_argument("path")
+    generate.add_argument("--instances", type=int, default=100)
+    generate.add_argument("--vertices", type=int, default=None,
+                          help="number of vertices, random between 50 and 100 by default")
+    generate.add_argument("--blockages", type=int, default=None,
+                          help="number of blockages, 10 * n by default")
+    generate.add_argument("--seed", type=int, default=0, help="master seed")
+    generate.add_argument("--append", action="store_true")
+
+    info = commands.add_parser("info", help="describe a corpus")
+    info.add_argument("path")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        generate_corpus(args.path, args.instances, args.seed, args.vertices, args.blockages, args.append)
+
+    reader = CorpusReader(args.path)
+    sizes = [entry["n"] for entry in reader.index]
+    print(f"{reader.path}: {len(reader)} instances, n in [{min(sizes, default=0)}, {max(sizes, default=0)}],"
+          f" {os.path.getsize(reader.path) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
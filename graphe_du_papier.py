@@ -1,3 +1,25 @@
+"""
+Graphs Gp and Gp+ of the paper (Hahn, Xefteris: The Covering Canadian Traveller Problem Revisited),
+used as adversarial instances of CR and CNN.
+
+construct_gp / construct_gp_plus build the dict form with tuple labels, construct_gp_plus_arrays
+builds Gp+ directly as a weight matrix and the array of the blocked pairs (vertex indices) for
+large p, and gp_plus_instance as an Instance that CR and CNN take as is.
+
+run from the root of the project:
+    python graphe_du_papier.py                       # prints Gp+ for p = 3
+    python graphe_du_papier.py sweep --p 1 8         # CR and CNN on Gp+ for p = 1 .. 8
+"""
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+
+from blockage_index import BlockageIndex, pairs_from_mask
+
+
 def construct_gp(p):
     """
     Construct the base graph Gp as described in the paper:
@@ -35,6 +57,10 @@ def construct_gp(p):
 
 
 def construct_gp_plus(p):
+    """
+    dict form of Gp+ with the labels of construct_gp, the blocked edges are the sorted pairs of the
+    string of the labels. See construct_gp_plus_arrays for the matrix form given to CR and CNN.
+    """
     gp = construct_gp(p)
     gp_plus = {node: neighbors.copy() for node, neighbors in gp.items()}
     all_nodes = list(gp_plus.keys())
@@ -88,6 +114,172 @@ def construct_gp_plus(p):
     return gp_plus, start_node, blocked_edges
 
 
+def gp_plus_labels(p):
+    """labels of the vertices of Gp+ in the order of the matrix: lower vertices, upper vertices, u"""
+    return [("lower", i) for i in range(2 ** p)] + [("upper", i) for i in range(2 ** p - 1)] + ["u"]
+
+
+def gp_plus_edges(p):
+    """the edges of Gp (cost 1) as two arrays of vertex indices, in the order of gp_plus_labels"""
+    lower = np.arange(2 ** p)
+    upper = 2 ** p + np.arange(2 ** p - 1)
+    # each triangle: lower i - lower i+1, lower i - upper i, upper i - lower i+1
+    a = np.concatenate([lower[:-1], lower[:-1], upper])
+    b = np.concatenate([lower[1:], upper, lower[1:]])
+    return a, b
+
+
+# blocked edges of Gp+
+VARIANTS = ("all", "u")
+
+
+def gp_plus_mask(p, dtype=np.int32, variant="all"):
+    """
+    weight matrix and boolean mask of the blocked edges of Gp+
+    Same graph as construct_gp_plus: Gp (cost 1), u linked to every vertex (cost 1), the other pairs cost 2.
+    variant:
+        "all": the edges of u and all the pairs outside Gp are blocked, like construct_gp_plus
+        "u": only the edges of u are blocked, k = n - 2 (the k < n - 1 of the k-CCTP)
+    In both cases the edge start - u stays open, otherwise u could not be reached
+    (the blocked graph must stay connected).
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown Gp+ variant: {variant}")
+    n = 2 ** (p + 1)
+    u = n - 1
+    a, b = gp_plus_edges(p)
+
+    matrix = np.full((n, n), 2, dtype=dtype)
+    matrix[u, :] = 1
+    matrix[:, u] = 1
+    matrix[a, b] = 1
+    matrix[b, a] = 1
+    np.fill_diagonal(matrix, 0)
+
+    if variant == "all":
+        mask = np.ones((n, n), dtype=bool)
+        mask[a, b] = False
+        mask[b, a] = False
+    else:
+        mask = np.zeros((n, n), dtype=bool)
+        mask[u, :] = True
+        mask[:, u] = True
+    mask[0, u] = mask[u, 0] = False
+    np.fill_diagonal(mask, False)
+    return matrix, mask
+
+
+def construct_gp_plus_arrays(p, dtype=np.int32, variant="all"):
+    """
+    Gp+ without the dict and the labels, O(n^2) numpy operations (p = 12 is 8192 vertices)
+    param:
+        p: size of the graph, 2^(p+1) vertices
+        dtype: dtype of the matrix
+        variant: blocked edges, see gp_plus_mask
+    return (matrix, blockages, start) blockages is the (k,2) int32 array of the blocked pairs,
+    start is the index of ("lower", 0)
+    """
+    matrix, mask = gp_plus_mask(p, dtype, variant)
+    return matrix, pairs_from_mask(mask), 0
+
+
+def gp_plus_instance(p, dtype=np.int32, variant="all"):
+    """Gp+ as an Instance (labels of gp_plus_labels), the blockage index is built from the mask"""
+    from instance import Instance
+
+    matrix, mask = gp_plus_mask(p, dtype, variant)
+    return Instance(matrix, BlockageIndex.from_mask(mask), labels=gp_plus_labels(p))
+
+
+def gp_plus_optimum(p, variant="all"):
+    """
+    cost of the optimal tour of Gp+ when the blockages are known, u is only reached by s - u - s (2)
+        "all": only Gp is left, between two consecutive lower vertices the tour goes once through
+               the upper vertex (2) and once on the lower edge (1), 3 (2^p - 1) + 2
+        "u": n + 2 for p >= 2, a tour of Gp without an edge of cost 2 would be a hamiltonian cycle
+             of Gp (there is none) and s is visited twice
+    """
+    if variant == "all" or p < 2:
+        return 3 * (2 ** p - 1) + 2
+    return 2 ** (p + 1) + 2
+
+
+# competitive ratios of the papers (asymptotic, the constants are not given)
+BOUNDS = {
+    "CR": ("O(sqrt k)", lambda k: math.sqrt(k)),      # Liao, Huang 2014
+    "CNN": ("O(log k)", lambda k: math.log2(max(k, 2))), # Hahn, Xefteris 2023
+}
+
+
+def sweep(ps, variants=VARIANTS, matching="blossom", blossom_max=1000, log=print):
+    """
+    CR and CNN on Gp+ for every p of ps and every variant, with the same christofides tour for both
+    param:
+        variants: the blocked edges of Gp+, see gp_plus_mask
+        matching: minimum_weight_matching method of christofides
+        blossom_max: above this number of vertices the "knn" matching is used instead of "blossom"
+    return one dict per (p, variant): costs, ratios to the optimum, bounds and times in seconds
+    """
+    from tour_cache import cached_christophides
+    from routage_cyclique import apply_routage_cyclique_ids
+    from cnn_algorithm import apply_cnn
+
+    runs = {
+        "CR": lambda instance, tour: apply_routage_cyclique_ids(tour, instance.blockages),
+        "CNN": lambda instance, tour: apply_cnn(instance.matrix, instance.blockages, tour),
+    }
+
+    results = []
+    for p, variant in ((p, variant) for p in ps for variant in variants):
+        start = time.perf_counter()
+        instance = gp_plus_instance(p, variant=variant)
+        k = len(instance.blockages)
+        method = "knn" if matching == "blossom" and instance.n > blossom_max else matching
+        row = {"p": p, "variant": variant, "n": instance.n, "k": k, "optimum": gp_plus_optimum(p, variant),
+               "matching": method, "build_s": time.perf_counter() - start}
+
+        start = time.perf_counter()
+        # the matrix is the same for all the variants, the tour is computed once (tour cache)
+        tour = cached_christophides(instance.matrix, matching=method)
+        row["christofides_s"] = time.perf_counter() - start
+
+        for name, run in runs.items():
+            start = time.perf_counter()
+            cost, error = None, None
+            try:
+                path = run(instance, list(tour))
+                if -1 in path:
+                    error = "no intermediate vertex found"
+                else:
+                    cost = instance.cost(path)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            row[f"{name}_s"] = time.perf_counter() - start
+            row[name] = cost
+            row[f"{name}_ratio"] = None if cost is None else cost / row["optimum"]
+            row[f"{name}_bound"] = BOUNDS[name][1](k)
+            row[f"{name}_error"] = error
+
+        results.append(row)
+        log(f"p={p} {variant} n={instance.n}: CR {row['CR']} ({row['CR_s']:.2f}s), CNN {row['CNN']} ({row['CNN_s']:.2f}s)"
+            + "".join(f" {name} {row[f'{name}_error']}" for name in runs if row[f"{name}_error"]))
+    return results
+
+
+def print_sweep(results):
+    print(f"{'p':>3} {'variant':>7} {'n':>6} {'k':>10} {'OPT':>6} {'CR':>7} {'CR/OPT':>7} {BOUNDS['CR'][0]:>10} "
+          f"{'CNN':>7} {'CNN/OPT':>8} {BOUNDS['CNN'][0]:>9} {'build':>7} {'christo':>8} {'CR (s)':>8} {'CNN (s)':>8}")
+    for row in results:
+        cells = []
+        for name in ("CR", "CNN"):
+            cells.append("-" if row[name] is None else f"{row[name]}")
+            cells.append("-" if row[f"{name}_ratio"] is None else f"{row[f'{name}_ratio']:.3f}")
+            cells.append(f"{row[f'{name}_bound']:.2f}")
+        print(f"{row['p']:>3} {row['variant']:>7} {row['n']:>6} {row['k']:>10} {row['optimum']:>6} {cells[0]:>7} {cells[1]:>7} "
+              f"{cells[2]:>10} {cells[3]:>7} {cells[4]:>8} {cells[5]:>9} {row['build_s']:>7.3f} "
+              f"{row['christofides_s']:>8.3f} {row['CR_s']:>8.3f} {row['CNN_s']:>8.3f}")
+
+
 def print_graph(G):
     """
     Print the graph G for easy readability
@@ -141,14 +333,35 @@ def print_graph(G):
     print("\n" + "=" * 80)
 
 
-if __name__ == "__main__":
-    p = 3
-    gp = construct_gp(p)
-    # print_graph(gp)
-    gp_plus, start_node, blocked = construct_gp_plus(p)
+def main():
+    parser = argparse.ArgumentParser(description="graphs Gp and Gp+ of the paper")
+    commands = parser.add_subparsers(dest="command")
+
+    show = commands.add_parser("show", help="print the graph Gp+")
+    show.add_argument("--p", type=int, default=3)
+
+    run = commands.add_parser("sweep", help="CR and CNN on Gp+ for a range of p")
+    run.add_argument("--p", type=int, nargs=2, default=[1, 8], metavar=("FIRST", "LAST"))
+    run.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=VARIANTS,
+                     help="blocked edges: all the edges outside Gp, or only the edges of u")
+    run.add_argument("--matching", default="blossom", choices=["blossom", "greedy", "knn"])
+    run.add_argument("--blossom-max", type=int, default=1000,
+                     help="largest number of vertices for which the blossom matching is used, knn above")
+    run.add_argument("--output", default=None, help="JSON file of the results")
+    args = parser.parse_args()
+
+    if args.command == "sweep":
+        results = sweep(range(args.p[0], args.p[1] + 1), args.variants, args.matching, args.blossom_max)
+        print_sweep(results)
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=1)
+            print(f"results written to {args.output}")
+        return
+
+    gp_plus, start_node, blocked = construct_gp_plus(args.p if args.command == "show" else 3)
     print_graph(gp_plus)
 
-    # print("Start Node:", start_node)
-    # print("Graph Nodes:")
-    # for node, neighbors in gp_plus.items():
-    #     print(f"  {node} -> {list(neighbors.keys())}")
+
+if __name__ == "__main__":
+    main()
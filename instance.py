@@ -0,0 +1,160 @@
+import numpy as np
+
+from blockage_index import BlockageIndex
+from candidate_graph import PointDistances, christofides_knn
+from local_search import improve_tour
+from sparse_graph import DistanceRows, to_csr, christofides_sparse, expand_path
+from tour_cache import cached_christophides
+from utils import transform_to_matrix, as_compact, sum_dtype
+
+
+class Instance:
+    """
+    an instance of the problem on the vertex indices: the weight matrix, the blocked edges
+    and optionally the label of each vertex.
+    The matrix is used as it is (no copy), e.g a np.memmap of a corpus or a float32 array,
+    apply_routage_cyclique and apply_cnn_to_routes return int arrays of vertex indices for an Instance.
+
+        instance = Instance(matrix, pairs)
+        path = apply_cnn_to_routes(instance)             # 1D int64 array
+        instance.to_labels(path), instance.cost(path)
+
+    The routes dict of the other functions is converted with Instance.from_routes.
+    A non complete graph (CSR or dict of neighbours) is given with Instance.from_sparse, the matrix
+    is then the lazy metric closure (sparse_graph.DistanceRows) and the paths returned by the
+    algorithms are expanded into real edges.
+    Points given by their coordinates (Instance.from_points) use the lazy euclidean distances
+    (candidate_graph.PointDistances) and the christofides of the k nearest neighbours graph.
+    """
+
+    def __init__(self, matrix, blockages=None, labels=None, compact=False):
+        """
+        param:
+            matrix: 2D square array of the weights, not copied (or a DistanceRows, a PointDistances)
+            compact: store the matrix on 4 bytes (int32 / float32) when it is exact, see utils.as_compact
+            (a copy if the dtype changes)
+            blockages: BlockageIndex or (k,2) array of blocked pairs as vertex indices, none by default
+            labels: optional 1D array with the label of each vertex
+        """
+        if not isinstance(matrix, (DistanceRows, PointDistances)):
+            matrix = as_compact(matrix) if compact else np.asarray(matrix)
+        if len(matrix.shape) != 2 or matrix.shape[0] != matrix.shape[1]:
+            raise ValueError(f"The matrix must be square, got shape {matrix.shape}")
+        self.matrix = matrix
+
+        n = len(matrix)
+        if blockages is None:
+            blockages = np.empty((0, 2), dtype=np.int64)
+        if not isinstance(blockages, BlockageIndex):
+            blockages = BlockageIndex.from_pairs(blockages, n)
+        self.blockages = blockages
+
+        if labels is not None:
+            # filled one by one so that tuple labels (e.g ("lower", 0)) stay single elements
+            array = np.empty(len(labels), dtype=object)
+            for i, label in enumerate(labels):
+                array[i] = label
+            labels = array
+            if len(labels) != n:
+                raise ValueError(f"{len(labels)} labels given for {n} vertices")
+        self.labels = labels
+
+    @classmethod
+    def from_routes(cls, routes, blockages=None):
+        """
+        adapter of the dict form
+        param:
+            routes: dict containing for each vertex a dict with the destination and the cost
+            blockages: 2D array of labels e.g [ ['A','B'],['A','C'] ]
+        """
+        n = len(routes)
+        if any(len(row) < n - 1 for row in routes.values()):
+            # some edges are missing, e.g Gp of graphe_du_papier
+            return cls.from_sparse(routes, blockages)
+        index = BlockageIndex.from_labels(blockages if blockages is not None else [], routes, keep_labels=False)
+        return cls(transform_to_matrix(routes), index, labels=list(routes.keys()))
+
+    @classmethod
+    def from_sparse(cls, adjacency, blockages=None, labels=None, maxsize=256):
+        """
+        instance on a non complete graph, the algorithms run on its metric closure
+        param:
+            adjacency: scipy sparse matrix (CSR ...) or dict of neighbours {u: {v: weight}}
+            blockages: blocked pairs of the closure, as vertex indices (labels for a dict)
+            labels: optional labels of the vertices (for a dict the keys are used)
+            maxsize: number of distance rows kept in memory
+        """
+        graph, dict_labels = to_csr(adjacency)
+        if dict_labels is not None:
+            labels = dict_labels
+            ids = {label: i for i, label in enumerate(labels)}
+            blockages = [[ids[a], ids[b]] for a, b in (blockages if blockages is not None else [])]
+        return cls(DistanceRows(graph, maxsize=maxsize), blockages, labels=labels)
+
+    @classmethod
+    def from_points(cls, points, blockages=None, labels=None):
+        """
+        instance on the euclidean distances between points, the n x n matrix is never built
+        param:
+            points: 2D array (n, d) of the coordinates
+            blockages: blocked pairs as vertex indices
+        """
+        return cls(PointDistances(points), blockages, labels=labels)
+
+    @property
+    def sparse(self):
+        """True if the matrix is the lazy metric closure of a sparse graph"""
+        return isinstance(self.matrix, DistanceRows)
+
+    @property
+    def n(self):
+        return len(self.matrix)
+
+    def tour(self, tracer=None, improve=None, large=False, **options):
+        """
+        the christofides tour of the instance (tour cache for a dense matrix)
+        improve: None, True or a dict of options of local_search.improve_tour (e.g {"budget": 0.05}),
+        the tour is then improved by 2-opt / Or-opt (not cached, the search depends on the budget)
+        large: christofides on the k nearest neighbours graph (candidate_graph.christofides_knn), the matrix
+        is only read by blocks of rows (e.g a np.memmap too large for the memory), always used for points
+        options: start_vertex, matching and k of apply_christophides (start_vertex and k for a sparse graph,
+        start_vertex, k and matching "greedy" or "blossom" for large)
+        """
+        if large or isinstance(self.matrix, PointDistances):
+            tour = christofides_knn(self.matrix, k=options.get("k", 10), start_vertex=options.get("start_vertex", 0),
+                                    matching=options.get("matching", "greedy"), tracer=tracer)
+        elif self.sparse:
+            tour = christofides_sparse(self.matrix, start_vertex=options.get("start_vertex", 0),
+                                       k=options.get("k", 10))
+        else:
+            tour = cached_christophides(self.matrix, tracer=tracer, **options)
+        if improve is not None and improve is not False:
+            tour = improve_tour(self.matrix, tour, tracer=tracer, **({} if improve is True else improve))
+        return tour
+
+    def expand(self, path):
+        """the path with real edges only: unchanged for a dense matrix, see sparse_graph.expand_path"""
+        if self.sparse:
+            return expand_path(self.matrix, path)
+        return path
+
+    def to_labels(self, path):
+        """the labels of a path of vertex indices, -1 (no intermediate vertex found by CR) is kept"""
+        if self.labels is None:
+            raise ValueError("The instance has no labels")
+        path = np.asarray(path, dtype=np.int64)
+        labels = self.labels[np.where(path < 0, 0, path)]
+        labels[path < 0] = -1
+        return labels.tolist()
+
+    def cost(self, path):
+        """cost of a path of vertex indices"""
+        path = np.asarray(path, dtype=np.int64)
+        return np.asarray(self.matrix[path[:-1], path[1:]]).sum(dtype=sum_dtype(self.matrix.dtype)).item()
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        kind = "sparse" if self.sparse else "points" if isinstance(self.matrix, PointDistances) else self.matrix.dtype
+        return f"Instance(n={self.n}, {kind}, blocked={len(self.blockages)})"
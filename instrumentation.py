@@ -0,0 +1,138 @@
+"""
+Opt-in instrumentation of Christofides, CR and CNN.
+
+The algorithms take a tracer=None argument, without tracer they are silent and only keep a few
+counters. With a Tracer:
+    - the callback receives the structured events of the run (a dict per event, e.g the paths of
+      every round of CR), it is only called (and the events only built) if a callback is given
+    - tracer.stats is a RunStats with the counters and the wall-clock time of each stage
+
+    tracer = Tracer(callback=print_events)
+    path = apply_routage_cyclique(routes, blockages, tracer=tracer)
+    print(tracer.stats)
+"""
+import time
+from contextlib import contextmanager
+
+
+class RunStats:
+    """
+    counters and per-stage wall-clock times of a run, e.g
+        counters: rounds, blockage_lookups, dijkstra_calls, matching_size, tour_length
+        stages: {"christofides": 0.01, "shortcut": 0.002, ...} in seconds
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.stages = {}
+
+    def count(self, name, k=1):
+        self.counters[name] = self.counters.get(name, 0) + k
+
+    def set(self, name, value):
+        self.counters[name] = value
+
+    @contextmanager
+    def stage(self, name):
+        """time the block, the times of the same stage are added"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def __getattr__(self, name):
+        # stats.rounds is stats.counters["rounds"], 0 if it has not been counted
+        if name.startswith("_") or name in ("counters", "stages"):
+            raise AttributeError(name)
+        return self.counters.get(name, 0)
+
+    def as_dict(self):
+        return {"counters": dict(self.counters), "stages": dict(self.stages)}
+
+    def __repr__(self):
+        counters = ", ".join(f"{k}={v}" for k, v in self.counters.items())
+        stages = ", ".join(f"{k}={v:.4f}s" for k, v in self.stages.items())
+        return f"RunStats({counters}; {stages})"
+
+
+class Tracer:
+    """
+    param:
+        callback: function called with each event (a dict with at least the key "event"), None to be silent
+        count_lookups: count every lookup of the blockage index (a small overhead per lookup)
+    """
+
+    def __init__(self, callback=None, count_lookups=True):
+        self.callback = callback
+        self.count_lookups = count_lookups
+        self.stats = RunStats()
+
+    @property
+    def enabled(self):
+        """True if the events are listened, the caller should not build them otherwise"""
+        return self.callback is not None
+
+    def event(self, name, **fields):
+        if self.callback is not None:
+            self.callback({"event": name, **fields})
+
+    def stage(self, name):
+        return self.stats.stage(name)
+
+    def count(self, name, k=1):
+        self.stats.count(name, k)
+
+    def watch(self, blockages):
+        """the blockage index to use in the run, it counts its lookups if count_lookups"""
+        if not self.count_lookups or isinstance(blockages, CountingBlockages):
+            return blockages
+        return CountingBlockages(blockages, self.stats)
+
+
+def get_tracer(tracer):
+    """the tracer of a run: the given one, or a silent one that does not count the lookups"""
+    if tracer is None:
+        return Tracer(count_lookups=False)
+    return tracer
+
+
+class CountingBlockages:
+    """BlockageIndex that counts its lookups in stats.counters["blockage_lookups"]"""
+
+    def __init__(self, index, stats):
+        self.index = index
+        self.stats = stats
+
+    def is_blocked(self, a, b):
+        self.stats.count("blockage_lookups")
+        return self.index.is_blocked(a, b)
+
+    def __contains__(self, edge):
+        self.stats.count("blockage_lookups")
+        return edge in self.index
+
+    def __getattr__(self, name):
+        # neighbors, degree, n, pairs ... of the index
+        return getattr(self.index, name)
+
+    def __len__(self):
+        return len(self.index)
+
+
+def print_events(event):
+    """callback that prints the events like the first versions of CR and CNN did"""
+    name = event["event"]
+    if name == "round":
+        print(f"P{event['round']}: {event['planned']} ")
+        print(f"Pcr: {event['taken']} ")
+        if event.get("unvisited") is not None:
+            print(f"Unvisited Vertices: {event['unvisited']}")
+        print()
+    elif name == "shortcut":
+        print(f"Shortcut Eb: {set(event['blocked'])}")
+    elif name == "cnn_path":
+        print(f"P1: {event['P1']}")
+        print(f"P2: {event['P2']}")
+    else:
+        print(event)
@@ -0,0 +1,237 @@
+"""
+Local search on the christofides tour, before CR and CNN: every unit of length of the tour is paid
+again by each round of CR and by the shortcut of CNN.
+
+Two moves, both restricted to the k nearest neighbours of each vertex (candidate lists):
+    - 2-opt: remove the edges a-b and c-d, add a-c and b-d (a segment of the tour is reversed)
+    - Or-opt: move a segment of 1 to 3 vertices between two other neighbouring vertices (maybe reversed)
+with don't-look bits: only the vertices near a change are looked at again (queue of active vertices).
+The search stops at a local optimum or when the wall-clock budget is spent.
+
+    tour = improve_tour(matrix, tour, budget=0.05, tracer=tracer)
+    tracer.stats.local_search_gain, tracer.stats.gain_per_ms
+
+Instance.tour(improve=...) applies it after the (cached) christofides tour.
+"""
+import time
+from collections import deque
+
+import numpy as np
+
+from instrumentation import get_tracer
+
+MOVES = ("2opt", "oropt")
+EPSILON = 1e-9 # smallest gain taken, avoids cycling on float rounding
+
+
+def _rows(matrix, start, stop):
+    """rows start..stop-1 of the matrix (or of a DistanceRows) as a float array"""
+    if isinstance(matrix, np.ndarray):
+        return np.array(matrix[start:stop], dtype=float)
+    return np.array(matrix.rows(np.arange(start, stop)), dtype=float)
+
+
+def neighbour_lists(matrix, k=8, block=2 ** 20):
+    """
+    the k nearest neighbours of each vertex, sorted by distance, itself excluded
+    param:
+        matrix: 2D array of the weights (or DistanceRows, every row is computed, or PointDistances)
+        k: number of neighbours
+        block: number of entries of the matrix read at once
+    return 2D int array (n, k)
+    """
+    if hasattr(matrix, "nearest"):
+        # e.g candidate_graph.PointDistances, KD-tree instead of the n rows
+        return matrix.nearest(k)[0]
+    n = len(matrix)
+    k = min(k, n - 1)
+    nearest = np.empty((n, max(k, 0)), dtype=np.int64)
+    if k <= 0:
+        return nearest
+    rows = max(1, block // n)
+    for start in range(0, n, rows):
+        stop = min(start + rows, n)
+        dist = _rows(matrix, start, stop)
+        dist[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        part = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(dist, part, axis=1), axis=1, kind="stable")
+        nearest[start:stop] = np.take_along_axis(part, order, axis=1)
+    return nearest
+
+
+def tour_cost(matrix, tour):
+    """cost of a closed tour"""
+    tour = np.asarray(tour, dtype=np.int64)
+    return float(np.asarray(matrix[tour[:-1], tour[1:]], dtype=float).sum())
+
+
+def improve_tour(matrix, tour, k=8, budget=None, moves=MOVES, neighbours=None, tracer=None):
+    """
+    2-opt / Or-opt local search of a closed tour
+    param:
+        matrix: 2D array of the weights (or DistanceRows, PointDistances)
+        tour: closed tour visiting every vertex once e.g [0,3,1,2,0]
+        k: size of the candidate lists
+        budget: wall-clock budget in seconds (neighbour lists included), None runs until a local optimum
+        moves: the moves used, "2opt" and/or "oropt"
+        neighbours: candidate lists already computed (see neighbour_lists), k is then not used
+        tracer: optional instrumentation.Tracer, gets the time of the stage, the number of moves,
+        the cost before / after, the gain and the gain per millisecond
+    return a new closed tour with the same start vertex, never longer than tour
+    """
+    unknown = set(moves) - set(MOVES)
+    if unknown:
+        raise ValueError(f"Unknown local search moves: {sorted(unknown)}")
+    tracer = get_tracer(tracer)
+    start_time = time.perf_counter()
+    deadline = None if budget is None else start_time + budget
+
+    t = np.asarray(tour[:-1], dtype=np.int64).copy()
+    n = len(t)
+    if n < 5:
+        return list(tour)
+    if len(np.unique(t)) != n:
+        raise ValueError("The tour must visit every vertex once")
+
+    with tracer.stage("local_search"):
+        before = tour_cost(matrix, tour)
+        if neighbours is None:
+            neighbours = neighbour_lists(matrix, k)
+        neighbours = np.asarray(neighbours).tolist()
+        search = _Search(matrix, t, neighbours)
+
+        two_opt = "2opt" in moves
+        or_opt = "oropt" in moves
+        queue = deque(t.tolist())
+        active = np.ones(len(matrix), dtype=bool)
+        while queue:
+            if deadline is not None and time.perf_counter() > deadline:
+                tracer.count("local_search_timeouts")
+                break
+            a = queue.popleft()
+            active[a] = False
+            touched = (two_opt and search.two_opt(a)) or (or_opt and search.or_opt(a))
+            if touched:
+                # don't-look bits: the ends of the changed edges are looked at again
+                for v in touched:
+                    if not active[v]:
+                        active[v] = True
+                        queue.append(v)
+
+        # same start vertex as the christofides tour
+        t = np.roll(search.t, -int(search.pos[tour[0]])).tolist()
+        t.append(t[0])
+        after = tour_cost(matrix, t)
+
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    tracer.count("two_opt_moves", search.two_opt_moves)
+    tracer.count("or_opt_moves", search.or_opt_moves)
+    tracer.stats.set("tour_cost_before", before)
+    tracer.stats.set("tour_cost_after", after)
+    tracer.stats.set("local_search_gain", before - after)
+    tracer.stats.set("gain_per_ms", (before - after) / elapsed_ms if elapsed_ms > 0 else 0.0)
+    return t
+
+
+class _Search:
+    """the tour as an array with the position of each vertex, and the two moves (first improvement)"""
+
+    def __init__(self, matrix, t, neighbours):
+        self.t = t
+        self.n = len(t)
+        self.pos = np.empty(len(matrix), dtype=np.int64)
+        self.pos[t] = np.arange(self.n)
+        self.neighbours = neighbours
+        self.d = matrix.item if isinstance(matrix, np.ndarray) else (lambda a, b: float(matrix[a, b]))
+        self.two_opt_moves = 0
+        self.or_opt_moves = 0
+
+    def succ(self, v):
+        return int(self.t[(self.pos[v] + 1) % self.n])
+
+    def pred(self, v):
+        return int(self.t[self.pos[v] - 1])
+
+    def reverse(self, i, j):
+        """reverse the positions i..j of the cycle (or the other side, the shorter one)"""
+        n = self.n
+        length = (j - i) % n + 1
+        if 2 * length > n:
+            i, j, length = (j + 1) % n, (i - 1) % n, n - length
+        index = (i + np.arange(length)) % n
+        segment = self.t[index][::-1]
+        self.t[index] = segment
+        self.pos[segment] = index
+
+    def two_opt(self, a):
+        """
+        first improving 2-opt move with an edge of a, a-b removed and a-c added for c near a
+        return the ends of the changed edges, None if there is none
+        """
+        d = self.d
+        for forward in (True, False):
+            b = self.succ(a) if forward else self.pred(a)
+            d_ab = d(a, b)
+            for c in self.neighbours[a]:
+                d_ac = d(a, c)
+                if d_ac >= d_ab:
+                    break # the lists are sorted, a-c can not replace a-b any more
+                if c == b:
+                    continue
+                e = self.succ(c) if forward else self.pred(c)
+                if e == a:
+                    continue
+                if d_ac + d(b, e) - d_ab - d(c, e) < -EPSILON:
+                    # ... a b ... c e ... becomes ... a c ... b e ...
+                    if forward:
+                        self.reverse(self.pos[b], self.pos[c])
+                    else:
+                        self.reverse(self.pos[a], self.pos[e])
+                    self.two_opt_moves += 1
+                    return (a, b, c, e)
+        return None
+
+    def or_opt(self, a):
+        """
+        first improving Or-opt move of the segments of 1 to 3 vertices starting at a,
+        inserted next to a neighbour of one of its ends
+        return the ends of the changed edges, None if there is none
+        """
+        d = self.d
+        n = self.n
+        for length in (1, 2, 3):
+            if n < length + 3:
+                break
+            segment = [int(self.t[(self.pos[a] + i) % n]) for i in range(length)]
+            s, e = segment[0], segment[-1]
+            p, nx = self.pred(s), self.succ(e)
+            removal = d(p, s) + d(e, nx) - d(p, nx) # gain of taking the segment out
+
+            for end, other in ((s, e), (e, s)):
+                for c in self.neighbours[end]:
+                    d_c = d(end, c)
+                    if d_c >= removal:
+                        break
+                    if c in segment:
+                        continue
+                    # end next to c, after c (c, end ... other, succ c) or before it (pred c, other ... end, c)
+                    c2 = self.succ(c)
+                    if c != p and d_c + d(other, c2) - d(c, c2) - removal < -EPSILON:
+                        self.move(segment, c, reverse=end == e)
+                        return (p, nx, c, c2, s, e)
+                    c1 = self.pred(c)
+                    if c != nx and d(c1, other) + d_c - d(c1, c) - removal < -EPSILON:
+                        self.move(segment, c1, reverse=end == s)
+                        return (p, nx, c1, c, s, e)
+        return None
+
+    def move(self, segment, left, reverse):
+        """move the segment (forward in the tour) just after the vertex left, reversed or not"""
+        n = self.n
+        length = len(segment)
+        rest = self.t[(self.pos[segment[-1]] + 1 + np.arange(n - length)) % n]
+        k = int(np.flatnonzero(rest == left)[0]) + 1
+        segment = np.asarray(segment[::-1] if reverse else segment, dtype=np.int64)
+        self.t = np.concatenate([rest[:k], segment, rest[k:]])
+        self.pos[self.t] = np.arange(n)
+        self.or_opt_moves += 1
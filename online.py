@@ -0,0 +1,282 @@
+"""
+Online (step by step) versions of CR and CNN: the traveller only learns the blocked edges of a
+vertex when he arrives at it, and asks the session for his next move at each arrival.
+
+    session = CRSession(instance)            # or CNNSession, instance: Instance or weight matrix
+    v = session.next_move                    # the start vertex
+    while v is not None:
+        # ... the traveller drives to v and sees which roads of v are blocked ...
+        v = session.arrive(v, blocked=[x for x in ... if v-x is blocked])
+    session.path                             # the vertices visited, in order
+
+The session keeps the tour, the visited vertices and the blocked edges revealed so far between two
+calls, an arrival only runs the part of the algorithm until the next move (a shortcut, a round of CR
+or a leg of NN). The only long step is the compress of CNN (once, when the traveller is back at
+the start after the shortcut).
+The moves are the same as the offline algorithms (apply_routage_cyclique_ids, apply_cnn) given
+the same tour: they only read the blocked edges of the vertices already visited. Without the
+blocked argument, arrive reads them from the blockages of the instance (simulation).
+"""
+import numpy as np
+
+from instance import Instance
+from instrumentation import get_tracer
+from routage_cyclique import find_intermediate_ids, get_non_visited_ids, reverse_order_ids, tour_position
+from cnn_algorithm import KnownGraph, LegCosts, compress, leg_path, unvisited_list
+
+
+class RevealedBlockages:
+    """
+    the blocked edges known by the traveller: those of the vertices he has arrived at.
+    It has the is_blocked / 'in' interface of BlockageIndex, asking for an edge between two vertices
+    not reached yet is an error (the algorithm would use information it does not have).
+    """
+
+    def __init__(self, n):
+        self.revealed = np.zeros(n, dtype=bool)
+        self.blocked = set() # canonical pairs (min, max)
+        self._neighbours = {} # blocked neighbours of each vertex
+
+    def reveal(self, v, blocked):
+        """
+        add the blocked edges v-x of the vertices x in blocked, nothing is done if v is already revealed
+        return the number of new blocked edges
+        """
+        if self.revealed[v]:
+            return 0
+        self.revealed[v] = True
+        before = len(self.blocked)
+        for x in blocked:
+            x = int(x)
+            if (min(v, x), max(v, x)) not in self.blocked:
+                self.blocked.add((min(v, x), max(v, x)))
+                self._neighbours.setdefault(v, []).append(x)
+                self._neighbours.setdefault(x, []).append(v)
+        return len(self.blocked) - before
+
+    def neighbors(self, v):
+        """the vertices x such that v-x is known to be blocked"""
+        if not self.revealed[v]:
+            raise ValueError(f"The blocked edges of {v} are not known yet")
+        return self._neighbours.get(v, [])
+
+    def is_blocked(self, a, b):
+        if not (self.revealed[a] or self.revealed[b]):
+            raise ValueError(f"The edge {a}-{b} is not known yet")
+        return (min(a, b), max(a, b)) in self.blocked
+
+    def __contains__(self, edge):
+        a, b = edge
+        return self.is_blocked(int(a), int(b))
+
+    def __len__(self):
+        return len(self.blocked)
+
+
+class Session:
+    """
+    common part of CRSession and CNNSession: the moves are given by the generator _run, which is
+    resumed at each arrival (after the blocked edges of the vertex are revealed)
+    """
+
+    def __init__(self, instance, tour=None, tracer=None):
+        """
+        param:
+            instance: Instance (or 2D weight matrix), its blockages are only used by arrive without blocked
+            tour: christofides tour in index, computed with the tour cache if not given
+            tracer: optional instrumentation.Tracer, counts the moves and the revealed blockages
+        """
+        if not isinstance(instance, Instance):
+            instance = Instance(instance)
+        self.instance = instance
+        self.tour = [int(v) for v in (instance.tour() if tour is None else tour)]
+        self.tracer = get_tracer(tracer)
+        self.known = RevealedBlockages(instance.n)
+        self.path = []
+        self.next_move = self.tour[0] # the traveller starts on the first vertex of the tour
+        self._moves = self._run()
+
+    @property
+    def done(self):
+        """True when the traveller is back and there is no move left"""
+        return self.next_move is None
+
+    def arrive(self, v, blocked=None):
+        """
+        the traveller arrives at v
+        param:
+            v: the vertex reached, it must be the last move returned (the start vertex for the first call)
+            blocked: the vertices x such that v-x is blocked, read from the instance if not given
+        return the next vertex to go to, None when the tour is finished
+        """
+        if self.next_move is None:
+            raise ValueError("The tour is finished")
+        if v != self.next_move:
+            raise ValueError(f"The next move is {self.next_move}, got an arrival at {v}")
+        if blocked is None:
+            blocked = self.instance.blockages.neighbors(v)
+
+        self.tracer.count("revealed_blockages", self.known.reveal(v, blocked))
+        self.path.append(v)
+        self.next_move = next(self._moves, None)
+        if self.next_move is not None:
+            self.tracer.count("moves")
+        return self.next_move
+
+    def run(self):
+        """simulate the whole tour with the blockages of the instance, return the path"""
+        v = self.next_move
+        while v is not None:
+            v = self.arrive(v)
+        return self.path
+
+    def cost(self):
+        """cost of the path taken so far"""
+        return self.instance.cost(self.path) if len(self.path) > 1 else 0
+
+    def _run(self):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}(n={self.instance.n}, moves={len(self.path)}, " \
+               f"known_blocked={len(self.known)}, next={self.next_move})"
+
+
+class CRSession(Session):
+    """online CR, same moves as apply_routage_cyclique_ids"""
+
+    def _run(self):
+        known = self.known
+        path = np.asarray(self.tour[:-1], dtype=int) # the last vertice is equal to the first one
+        path_l = path.tolist()
+        L = len(path_l)
+        position = tour_position(self.tour)
+        last_vertice = path_l[0]
+
+        visited = np.zeros(L, dtype=bool)
+        visited[last_vertice] = True
+        visit_order = [last_vertice]
+        complete_path = [last_vertice]
+
+        # first iteration, see apply_first_iteration_ids
+        taken_path = [last_vertice]
+        source = last_vertice
+        i = 1
+        while i != L:
+            if known.is_blocked(source, path_l[i]):
+                while i + 1 < L and known.is_blocked(source, path_l[i]):
+                    i += 1
+                if known.is_blocked(source, path_l[i]):
+                    break # we can't go to the last vertice
+            dest = path_l[i]
+            i += 1
+            yield dest
+            taken_path.append(dest)
+            visited[dest] = True
+            visit_order.append(dest)
+            complete_path.append(dest)
+            source = dest
+
+        forward = True
+        last_to_take = path_l[-1]
+        non_visited = get_non_visited_ids(path, visited, forward)
+        stuck = 0
+
+        # m iteration, see apply_iteration_m_ids
+        while len(non_visited) != 0:
+            if not (len(taken_path) > 0 and taken_path[-1] == last_to_take):
+                non_visited = reverse_order_ids(complete_path[-1], non_visited, position, forward)
+                forward = not forward
+
+            source = complete_path[-1]
+            taken_path = []
+            for dest in non_visited.tolist():
+                if known.is_blocked(source, dest):
+                    next_vertice = find_intermediate_ids(source, dest, path, position, forward, visited, known)
+                    if next_vertice == -1:
+                        continue
+                    yield next_vertice
+                    taken_path.append(next_vertice)
+                yield dest
+                taken_path.append(dest)
+                visited[dest] = True
+                visit_order.append(dest)
+                source = dest
+            complete_path += taken_path
+            last_to_take = int(non_visited[-1])
+
+            stuck = stuck + 1 if len(taken_path) == 0 else 0
+            if stuck == 2:
+                raise Exception(f"Aucun chemin a été trouvé pour accéder aux sommets {non_visited.tolist()} depuis {complete_path[-1]} ")
+            non_visited = get_non_visited_ids(path, visited, forward)
+
+        # last iteration
+        source = complete_path[-1]
+        if known.is_blocked(source, last_vertice):
+            for x in visit_order:
+                if not known.is_blocked(source, x) and not known.is_blocked(x, last_vertice):
+                    yield x
+                    break
+            else:
+                raise Exception(f"Aucun sommet intermédiaire pour revenir en {last_vertice} depuis {source} ")
+        yield last_vertice
+
+
+class CNNSession(Session):
+    """online CNN, same moves as apply_cnn"""
+
+    def _run(self):
+        known = self.known
+        tour = self.tour
+
+        # shortcut, see cnn_algorithm.shortcut
+        U = {tour[0]}
+        P1 = [tour[0]]
+        i = 0
+        for j in range(1, len(tour)):
+            if known.is_blocked(tour[i], tour[j]):
+                U.add(tour[j])
+            else:
+                yield tour[j]
+                P1.append(tour[j])
+                i = j
+        if known.is_blocked(tour[i], tour[0]):
+            yield from P1[::-1][1:] # back to the start on the same path
+
+        if len(U) <= 1:
+            return
+
+        # every edge with a visited end is known, G* is the matrix with the blocked edges revealed
+        G_star = KnownGraph(self.instance.matrix, known.blocked)
+        with self.tracer.stage("compress"):
+            G_prime, paths = compress(G_star, U, start_vertex=tour[0])
+        yield from self._nearest_neighbor(LegCosts(G_star, G_prime, paths, unvisited_list(U, tour[0])))
+
+    def _nearest_neighbor(self, legs):
+        """the moves of cnn_algorithm.nearest_neighbor"""
+        n = len(legs.U)
+        visited = np.zeros(n, dtype=bool)
+        visited[0] = True
+        nb_visited = 1
+        current = 0
+        path = []
+
+        while nb_visited != n:
+            direct = legs.row(current, self.known.neighbors(int(legs.U[current])))
+            min_index = int(np.argmin(np.where(visited, np.inf, legs.G_prime[current])))
+            if visited[min_index]:
+                min_index = int(np.argmin(visited))
+            if not np.isfinite(legs.cost(current, min_index, direct)):
+                raise Exception(f"Aucun chemin a été trouvé pour accéder le sommet {legs.U[min_index]} depuis {legs.U[current]} ")
+
+            for v in legs.path(current, min_index, direct):
+                yield v
+                path.append(v)
+            visited[min_index] = True
+            nb_visited += 1
+            current = min_index
+
+        if not np.isfinite(legs.G_prime[current][0]):
+            yield from path[::-1][1:] + [int(legs.U[0])]
+        else:
+            yield from leg_path(legs.paths, int(legs.U[current]), int(legs.U[0]))
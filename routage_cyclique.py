@@ -1,16 +1,9 @@
-from christofides import apply_christophides
-from utils import transform_to_matrix,get_path_in_letters,create_symmetric_blockage,calculate_cost
-routes = {
-    'A': {'A':0, 'B': 1, 'C':2,'D': 1,'E':1},
-    'B': {'A': 1, 'B':0, 'C':1, 'D': 2, 'E': 1},
-    'C': {'A': 2, 'B':1, 'C':0, 'D': 1, 'E': 1},
-    'D': {'A': 1, 'B':2, 'C':1, 'D': 0, 'E': 1},
-    'E': {'A': 1, 'B':1, 'C':1, 'D': 1, 'E': 0},
-}
-
-blockages = [
-    ['D', 'E'],['E','D']
-]
+import numpy as np
+from tour_cache import cached_christophides
+from utils import transform_to_matrix,get_path_in_letters,calculate_cost
+from blockage_index import BlockageIndex
+from instance import Instance
+from instrumentation import get_tracer
 
 def find_next_vertice_after_block(from_source, blocked_dest,blockages,path,i):
     """
@@ -235,36 +228,72 @@ def reverse_order(last_visited,non_visited_vertices,initial_path):
 
 
 
-def apply_routage_cyclique(routes,blockages):
+def apply_routage_cyclique(routes,blockages=None,engine="ids",tracer=None,improve=None):
     """
     main function for the CR algorithm
     param:
         routes: dict containing for each vertex a dict with the destination and the cost e.g {'V1': {'V1':0,'V2':1,'V3':3...},'V2': {'V1':1,'V2':0}..}
+        or an Instance (matrix + blockages in index), in that case blockages is not used
         blockages: 2D array containing all the blockages e.g [ [A,B],[A,C] ] if we can't take the edge A-B nor A-C
+        engine: "ids" runs CR on the vertex indices (apply_routage_cyclique_ids) and converts the labels at the end,
+        "labels" is the original implementation on the labels (routes dict only), both return the same path
+        tracer: optional instrumentation.Tracer, receives one "round" event per round (P_m, Pcr and the unvisited vertices)
+        and collects the stats of the run
+        improve: optional local search of the christofides tour, see Instance.tour (engine "ids" only)
 
-    return CR algorithm output, from one source
+    return CR algorithm output, from one source: the labels for a routes dict,
+    a 1D int64 array of vertex indices for an Instance.
+    For a non complete graph the path is expanded into real edges
 
     """
+    if engine == "labels":
+        return apply_routage_cyclique_labels(routes,blockages,tracer=tracer)
+    if engine != "ids":
+        raise ValueError(f"Unknown CR engine: {engine}")
+    tracer = get_tracer(tracer)
+
+    instance = routes if isinstance(routes,Instance) else Instance.from_routes(routes,blockages)
+    with tracer.stage("christofides"):
+        christofides_path = instance.tour(tracer=tracer,improve=improve)
+
+    complete_path = apply_routage_cyclique_ids(christofides_path,instance.blockages,tracer=tracer)
+    # real edges for a sparse graph
+    complete_path = instance.expand(complete_path)
+
+    if isinstance(routes,Instance):
+        return np.asarray(complete_path,dtype=np.int64)
+    # -1 is kept as it is, it means no intermediate vertex could be found in the last iteration
+    return instance.to_labels(complete_path)
+
+
+def apply_routage_cyclique_labels(routes,blockages,tracer=None):
+    """
+    original implementation of the CR algorithm working on the labels,
+    see apply_routage_cyclique for the parameters
+    """
+    tracer = get_tracer(tracer)
     matrix = transform_to_matrix(routes)
-    christofides_path = apply_christophides(matrix)
+    with tracer.stage("christofides"):
+        christofides_path = cached_christophides(matrix,tracer=tracer)
     path_to_take = get_path_in_letters(christofides_path,routes)
 
     path_to_take = path_to_take[:-1] # i just remove the last vertice because it is equal to the first one
     initial_path = path_to_take
     last_vertice = path_to_take[0] # last and first are equal
 
-    blockages = create_symmetric_blockage(blockages)
+    blockages = tracer.watch(BlockageIndex.from_labels(blockages,routes))
     
     # first iteration
-    taken_path = apply_first_iteration(path_to_take,blockages)
+    with tracer.stage("first_iteration"):
+        taken_path = apply_first_iteration(path_to_take,blockages)
     visited_vertices = taken_path
     complete_path = taken_path.copy() # this is the results
     non_visited_vertices = get_non_visited_vertice(initial_path,taken_path)
+    tracer.count("rounds")
 
     # m iteration
-    print(f"P1: {path_to_take} ")
-    print(f"Pcr: {taken_path} ")
-    print(f"Unvisited Vertices: {non_visited_vertices}\n")
+    tracer.event("round",algorithm="CR",round=1,planned=list(path_to_take),taken=list(taken_path),
+                 unvisited=list(non_visited_vertices))
 
     m = 2
     while len(non_visited_vertices) != 0:
@@ -276,53 +305,275 @@ def apply_routage_cyclique(routes,blockages):
             non_visited_vertices =  reverse_order(complete_path[-1],non_visited_vertices,initial_path)
             initial_path = list(reversed(initial_path))
             
-        print(f"P{m}: {[complete_path[-1]] + non_visited_vertices} ")
-        taken_path,visited_vertices =  apply_iteration_m(path_to_take=non_visited_vertices,
-                                                         source=complete_path[-1],
-                                                         visited_vertices=visited_vertices,
-                                                         initial_path=initial_path,
-                                                         blockages=blockages)
+        planned = [complete_path[-1]] + non_visited_vertices
+        with tracer.stage("iteration_m"):
+            taken_path,visited_vertices =  apply_iteration_m(path_to_take=non_visited_vertices,
+                                                             source=complete_path[-1],
+                                                             visited_vertices=visited_vertices,
+                                                             initial_path=initial_path,
+                                                             blockages=blockages)
         
-        print(f"Pcr: {[complete_path[-1]] + taken_path}")
+        taken = [complete_path[-1]] + taken_path
         complete_path += taken_path
         path_to_take = non_visited_vertices
 
         non_visited_vertices  = get_non_visited_vertice(initial_path,visited_vertices)
         
-        
-        print(f"Unvisited Vertices: {non_visited_vertices}\n")
+        tracer.count("rounds")
+        tracer.event("round",algorithm="CR",round=m,planned=planned,taken=taken,unvisited=list(non_visited_vertices))
         m += 1
 
     # last iteration
-    taken_path = apply_last_iteration(goal_vertice=last_vertice,
-                                      source=complete_path[-1],
-                                      visited_vertices=visited_vertices,
-                                       blockages=blockages)
+    with tracer.stage("last_iteration"):
+        taken_path = apply_last_iteration(goal_vertice=last_vertice,
+                                          source=complete_path[-1],
+                                          visited_vertices=visited_vertices,
+                                          blockages=blockages)
+
+    tracer.count("rounds")
+    tracer.event("round",algorithm="CR",round=m,planned=[complete_path[-1]] + [last_vertice],
+                 taken=[complete_path[-1]] + taken_path,unvisited=None)
+
+    complete_path += taken_path
+
+    return complete_path
+
+
+def apply_first_iteration_ids(path,blockages):
+    """
+    same as apply_first_iteration with vertex indices
+    param:
+        path: 1D christofides path in index (without the last vertex)
+        blockages: BlockageIndex
+    return the path taken during the first iteration
+    """
+    is_blocked = blockages.is_blocked
+    source = path[0]
+    P1_cr = [source]
+
+    i = 1
+    while i != len(path):
+        dest = path[i]
+
+        if is_blocked(source,dest):
+            # find_next_vertice_after_block
+            while is_blocked(source,path[i]):
+                if i + 1 == len(path):
+                    return P1_cr # we can't go to the last vertice
+                i += 1
+            dest = path[i]
+        i += 1
+        P1_cr.append(dest)
+        source = dest
+
+    return P1_cr
+
+
+def find_intermediate_ids(source,dest,path,position,forward,visited,blockages):
+    """
+    same as find_intermediaire_vertice followed by find_next_vertice_with_intermediate with vertex indices:
+    the first visited vertex x between source and dest (following the current direction)
+    such that source-x and x-dest are not blocked.
+    The positions are read by chunks of growing size and filtered on visited with numpy,
+    most of the time the first visited vertex is the good one.
+    param:
+        source, dest: vertex indices
+        path: 1D numpy array, the christofides path in index (original direction)
+        position: 1D numpy array, position[v] is the index of v in path
+        forward: True if we follow the original direction of the path
+        visited: 1D numpy bool array of the visited vertices
+        blockages: BlockageIndex
+    return the intermediate vertex, -1 if there is none
+    """
+    L = len(path)
+    step = 1 if forward else -1
+    count = (step * (position[dest] - position[source]) - 1) % L
+    first = position[source] + step
+
+    is_blocked = blockages.is_blocked
+    done = 0
+    chunk = 64
+    while done < count:
+        size = min(chunk,count - done)
+        candidates = path[(first + step * np.arange(done,done + size)) % L]
+        for x in candidates[visited[candidates]].tolist():
+            if not is_blocked(source,x) and not is_blocked(x,dest):
+                return x
+        done += size
+        chunk *= 2
+
+    return -1
+
+
+def apply_iteration_m_ids(path_to_take,source,visited,visit_order,path,position,forward,blockages):
+    """
+    same as apply_iteration_m with vertex indices
+    param:
+        path_to_take: 1D array of the vertices we should try to visit in this order
+        source: the vertex we start from
+        visited: 1D numpy bool array of the visited vertices, updated in place
+        visit_order: list of the visited vertices in the order of visit, updated in place
+        path, position, forward: christofides path, position of each vertex in it and current direction
+        blockages: BlockageIndex
+    return the path we have been able to take
+    """
+    is_blocked = blockages.is_blocked
+    taken_path = []
+
+    for dest in path_to_take:
+        if is_blocked(source,dest):
+            next_vertice = find_intermediate_ids(source,dest,path,position,forward,visited,blockages)
+            # could not find intermediare vertex, same source, different dest
+            if next_vertice == -1:
+                continue
+            taken_path.append(next_vertice)
+
+        taken_path.append(dest)
+        visited[dest] = True
+        visit_order.append(dest)
+        source = dest
+
+    return taken_path
+
+
+def get_non_visited_ids(path,visited,forward):
+    """the non visited vertices in the order of the current direction"""
+    non_visited = path[~visited[path]]
+    return non_visited if forward else non_visited[::-1]
+
+
+def reverse_order_ids(last_visited,non_visited,position,forward):
+    """
+    same as reverse_order with vertex indices, non_visited is in the order of the current direction
+    the vertices before last_visited and the vertices after are both reversed
+    """
+    L = len(position)
+    current = position[non_visited] if forward else L - 1 - position[non_visited]
+    last = position[last_visited] if forward else L - 1 - position[last_visited]
+    split = np.searchsorted(current,last)
+
+    return np.concatenate([non_visited[:split][::-1],non_visited[split:][::-1]])
 
-    print(f"P{m}: {[complete_path[-1]] + [last_vertice]}")
-    print(f"Pcr: {[complete_path[-1]] + taken_path}\n")
 
+def tour_position(tour):
+    """position of each vertex in the tour (without its last vertex), e.g [0,3,1,2,0] gives [0,2,3,1]"""
+    path = np.asarray(tour[:-1],dtype=int)
+    position = np.empty(len(path),dtype=int)
+    position[path] = np.arange(len(path))
+    return position
+
+
+def apply_routage_cyclique_ids(tour,blockages,tracer=None,position=None):
+    """
+    CR algorithm on the vertex indices, it returns the same path as the original implementation
+    on the labels but uses a position array of the tour instead of path.index,
+    a boolean visited array instead of 'v in visited' and numpy to extract the non visited vertices
+    param:
+        tour: christofides tour in index, e.g [0,3,4,2,1,0]
+        blockages: BlockageIndex built with the vertex indices
+        tracer: optional instrumentation.Tracer, see apply_routage_cyclique
+        position: tour_position(tour), given when the same tour is used for many blockages
+    return CR algorithm output in index
+    """
+    tracer = get_tracer(tracer)
+    blockages = tracer.watch(blockages)
+
+    path = np.asarray(tour[:-1],dtype=int) # the last vertice is equal to the first one
+    path_l = path.tolist()
+    if position is None:
+        position = tour_position(tour)
+    last_vertice = path_l[0]
+
+    # first iteration
+    with tracer.stage("first_iteration"):
+        taken_path = apply_first_iteration_ids(path_l,blockages)
+    visited = np.zeros(len(path),dtype=bool)
+    visited[taken_path] = True
+    visit_order = list(taken_path)
+    complete_path = list(taken_path)
+
+    forward = True
+    last_to_take = path_l[-1]
+    non_visited = get_non_visited_ids(path,visited,forward)
+    stuck = 0
+    m = 1
+    tracer.count("rounds")
+    if tracer.enabled:
+        tracer.event("round",algorithm="CR",round=m,planned=path_l,taken=list(taken_path),unvisited=non_visited.tolist())
+
+    # m iteration
+    while len(non_visited) != 0:
+        if not (len(taken_path) > 0 and taken_path[-1] == last_to_take):
+            # we couldn't go to the last vertice we should change the order
+            non_visited = reverse_order_ids(complete_path[-1],non_visited,position,forward)
+            forward = not forward
+
+        source = complete_path[-1]
+        with tracer.stage("iteration_m"):
+            taken_path = apply_iteration_m_ids(path_to_take=non_visited.tolist(),
+                                               source=source,
+                                               visited=visited,
+                                               visit_order=visit_order,
+                                               path=path,
+                                               position=position,
+                                               forward=forward,
+                                               blockages=blockages)
+        complete_path += taken_path
+        m += 1
+        tracer.count("rounds")
+        last_to_take = int(non_visited[-1])
+
+        # two rounds without any move in both directions, the state is the same as before and it would loop forever
+        stuck = stuck + 1 if len(taken_path) == 0 else 0
+        if stuck == 2:
+            raise Exception(f"Aucun chemin a été trouvé pour accéder aux sommets {non_visited.tolist()} depuis {complete_path[-1]} ")
+
+        planned = non_visited
+        non_visited = get_non_visited_ids(path,visited,forward)
+        if tracer.enabled:
+            tracer.event("round",algorithm="CR",round=m,planned=[source] + planned.tolist(),
+                         taken=[source] + taken_path,unvisited=non_visited.tolist())
+
+    # last iteration
+    source = complete_path[-1]
+    with tracer.stage("last_iteration"):
+        if blockages.is_blocked(source,last_vertice):
+            next_vertice = -1
+            for x in visit_order:
+                if not blockages.is_blocked(source,x) and not blockages.is_blocked(x,last_vertice):
+                    next_vertice = x
+                    break
+            taken_path = [next_vertice,last_vertice]
+        else:
+            taken_path = [last_vertice]
     complete_path += taken_path
 
+    m += 1
+    tracer.count("rounds")
+    tracer.stats.set("tour_length",len(tour))
+    if tracer.enabled:
+        tracer.event("round",algorithm="CR",round=m,planned=[source,last_vertice],taken=[source] + taken_path,unvisited=None)
+
     return complete_path
 
 
-routes = {
-    'A': {'A':0, 'B': 1, 'C':2,'D': 1,'E':1},
-    'B': {'A': 1, 'B':0, 'C':1, 'D': 2, 'E': 1},
-    'C': {'A': 2, 'B':1, 'C':0, 'D': 1, 'E': 1},
-    'D': {'A': 1, 'B':2, 'C':1, 'D': 0, 'E': 1},
-    'E': {'A': 1, 'B':1, 'C':1, 'D': 1, 'E': 0},
-}
+if __name__ == "__main__":
+    # Example usage: python routage_cyclique.py
+    routes = {
+        'A': {'A':0, 'B': 1, 'C':2,'D': 1,'E':1},
+        'B': {'A': 1, 'B':0, 'C':1, 'D': 2, 'E': 1},
+        'C': {'A': 2, 'B':1, 'C':0, 'D': 1, 'E': 1},
+        'D': {'A': 1, 'B':2, 'C':1, 'D': 0, 'E': 1},
+        'E': {'A': 1, 'B':1, 'C':1, 'D': 1, 'E': 0},
+    }
 
-blockages = [
-    ['D', 'E']
-]
+    blockages = [
+        ['D', 'E']
+    ]
 
-# Example usage
-complete_path = apply_routage_cyclique(routes,blockages)
-print(f"Complete path: {complete_path}")
-print(f"Cost: {calculate_cost(complete_path,base_tuple=routes) }")
+    complete_path = apply_routage_cyclique(routes,blockages)
+    print(f"Complete path: {complete_path}")
+    print(f"Cost: {calculate_cost(complete_path,base_tuple=routes) }")
 
 
 
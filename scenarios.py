@@ -0,0 +1,169 @@
+"""
+Batch of blockage scenarios on the same distance matrix (e.g thousands of blockage sets of one city).
+
+The christofides tour does not depend on the blockages: it is computed once with the position of
+every vertex in it, then each scenario only builds its BlockageIndex and runs CR and CNN.
+The results are streamed in the order of the scenarios, one dict per scenario.
+
+    batch = ScenarioBatch(matrix)                 # or an Instance, or a routes dict
+    for result in batch.solve(scenarios, workers=8):
+        result["CR"], result["CNN"]               # costs, the paths in result["CR_path"] ...
+
+With workers > 1 the scenarios are spread over a process pool, the matrix is copied once into a
+shared memory block that every worker maps read only (it is not pickled for each scenario).
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from instance import Instance
+from routage_cyclique import apply_routage_cyclique_ids, tour_position
+from cnn_algorithm import apply_cnn
+
+ALGORITHMS = ("CR", "CNN")
+
+
+def solve_scenario(matrix, tour, position, blockages, algorithms=ALGORITHMS, keep_paths=True, index=None):
+    """
+    CR and/or CNN on one scenario
+    param:
+        matrix: the weight matrix (or the DistanceRows of a sparse graph)
+        tour, position: christofides tour and tour_position(tour)
+        blockages: (k,2) blocked pairs as vertex indices
+        keep_paths: the paths are added to the result (1D int64 arrays), otherwise only the costs
+    return dict {"index", "blocked", name: cost, name + "_path": path, name + "_error": error}
+    """
+    instance = Instance(matrix, blockages)
+    result = {"index": index, "blocked": len(instance.blockages)}
+    runs = {
+        "CR": lambda: apply_routage_cyclique_ids(tour, instance.blockages, position=position),
+        "CNN": lambda: apply_cnn(matrix, instance.blockages, tour),
+    }
+
+    for name in algorithms:
+        cost, path, error = None, None, None
+        try:
+            path = runs[name]()
+            if -1 in path:
+                error = "no intermediate vertex found"
+            else:
+                path = np.asarray(instance.expand(path), dtype=np.int64)
+                cost = instance.cost(path)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        result[name] = cost
+        if keep_paths:
+            result[f"{name}_path"] = path
+        result[f"{name}_error"] = error
+    return result
+
+
+class ScenarioBatch:
+    """
+    the part shared by all the scenarios: the matrix, the tour and its position index
+    """
+
+    def __init__(self, base, tour=None, algorithms=ALGORITHMS, keep_paths=True, **options):
+        """
+        param:
+            base: Instance, 2D weight matrix or routes dict (its blockages are not used)
+            tour: christofides tour in index, computed once (tour cache) if not given
+            algorithms: the algorithms run on each scenario, "CR" and/or "CNN"
+            keep_paths: keep the paths in the results, otherwise only the costs are sent back
+            options: options of Instance.tour (matching, k ...)
+        """
+        unknown = set(algorithms) - set(ALGORITHMS)
+        if unknown:
+            raise ValueError(f"Unknown algorithms: {sorted(unknown)}")
+
+        # the scenarios of a routes dict are given with its labels
+        self.ids = None
+        if isinstance(base, dict):
+            base = Instance.from_routes(base)
+            self.ids = {label: i for i, label in enumerate(base.labels)}
+        elif not isinstance(base, Instance):
+            base = Instance(base)
+        self.instance = base
+        self.tour = [int(v) for v in (base.tour(**options) if tour is None else tour)]
+        self.position = tour_position(self.tour)
+        self.algorithms = tuple(algorithms)
+        self.keep_paths = keep_paths
+
+    def pairs(self, blockages):
+        """blocked pairs of a scenario as vertex indices"""
+        if self.ids is not None:
+            return np.array([[self.ids[a], self.ids[b]] for a, b in blockages], dtype=np.int64).reshape(-1, 2)
+        return blockages
+
+    def solve_one(self, blockages, index=None):
+        """result of one scenario (see solve_scenario)"""
+        return solve_scenario(self.instance.matrix, self.tour, self.position, self.pairs(blockages),
+                              self.algorithms, self.keep_paths, index)
+
+    def solve(self, scenarios, workers=1, window=None):
+        """
+        yield the result of every scenario, in the order of scenarios
+        param:
+            scenarios: iterable of blockage sets ((k,2) vertex indices, labels for a routes dict),
+                       read as the results are consumed
+            workers: number of processes, 1 runs in the current process, None uses all the cores
+            window: number of scenarios sent to the pool in advance, 4 per worker by default
+        """
+        if workers == 1:
+            for index, blockages in enumerate(scenarios):
+                yield self.solve_one(blockages, index)
+            return
+
+        if window is None:
+            window = 4 * (workers or os.cpu_count() or 1)
+        matrix = self.instance.matrix
+        shared = None
+        if isinstance(matrix, np.ndarray):
+            # one copy in shared memory, mapped by the workers instead of pickled
+            shared = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+            np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=shared.buf)[...] = matrix
+            source = ("shared", shared.name, matrix.shape, matrix.dtype.str)
+        else:
+            source = ("object", matrix) # e.g the DistanceRows of a sparse graph, only its graph is big
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(source, self.tour, self.position, self.algorithms,
+                                               self.keep_paths)) as pool:
+                pending = deque()
+                for index, blockages in enumerate(scenarios):
+                    pending.append(pool.submit(_solve_in_worker, self.pairs(blockages), index))
+                    if len(pending) >= window:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+        finally:
+            if shared is not None:
+                shared.close()
+                shared.unlink()
+
+    def __repr__(self):
+        return f"ScenarioBatch({self.instance!r}, algorithms={self.algorithms})"
+
+
+# state of a worker process, set once by _init_worker
+_WORKER = {}
+
+
+def _init_worker(source, tour, position, algorithms, keep_paths):
+    if source[0] == "shared":
+        _, name, shape, dtype = source
+        shared = shared_memory.SharedMemory(name=name)
+        matrix = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shared.buf)
+        matrix.flags.writeable = False
+        _WORKER["shared"] = shared # keeps the mapping alive
+    else:
+        matrix = source[1]
+    _WORKER.update(matrix=matrix, tour=tour, position=position, algorithms=algorithms, keep_paths=keep_paths)
+
+
+def _solve_in_worker(blockages, index):
+    w = _WORKER
+    return solve_scenario(w["matrix"], w["tour"], w["position"], blockages, w["algorithms"], w["keep_paths"], index)
@@ -0,0 +1,277 @@
+"""
+Support of the non complete graphs (road networks, Gp of graphe_du_papier ...).
+
+CR, CNN and Christofides work on a complete metric graph, for a sparse graph this metric is
+the shortest path distance (metric closure). It is never built as a dense n x n matrix:
+    - DistanceRows gives the rows of the closure with one Dijkstra per row, only for the rows
+      the algorithms read, and keeps the last rows in a LRU cache
+    - christofides_sparse builds the tour with the minimum spanning tree of the sparse graph
+      (same weight as the one of the closure) and a k nearest neighbours matching
+    - expand_path replaces every edge of the closure of a path by the real edges of a shortest path
+The memory is O(edges + maxsize * n) instead of O(n^2).
+scipy is imported in the functions that use it, importing this module (for the classes) stays cheap.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from christofides import blossom_matching, greedy_matching, build_multigraph_csr, euler_tour_csr, shortcut_tour
+
+# memory used by the distance rows computed at once (dijkstra with several sources)
+BATCH_BYTES = 64 * 2 ** 20
+
+
+def to_csr(adjacency, labels=None):
+    """
+    symmetric csr_array of a sparse graph
+    param:
+        adjacency: scipy sparse matrix / array, or dict of neighbours e.g {'A': {'B': 1}, 'B': {'A': 1, 'C': 2}, 'C': {}}
+        labels: for a dict, the order of the vertices (the keys and their neighbours by default)
+    return (csr_array, labels) the labels are None for a scipy input
+    """
+    from scipy.sparse import csr_array
+
+    if isinstance(adjacency, dict):
+        if labels is None:
+            labels = list(adjacency)
+            seen = set(labels)
+            for neighbours in adjacency.values():
+                for v in neighbours:
+                    if v not in seen:
+                        seen.add(v)
+                        labels.append(v)
+        ids = {label: i for i, label in enumerate(labels)}
+        rows, cols, weights = [], [], []
+        for u, neighbours in adjacency.items():
+            for v, w in neighbours.items():
+                if u != v:
+                    rows.append(ids[u])
+                    cols.append(ids[v])
+                    weights.append(w)
+        graph = csr_array((np.asarray(weights, dtype=float), (rows, cols)), shape=(len(labels), len(labels)))
+    else:
+        graph = csr_array(adjacency, dtype=float)
+        labels = None
+
+    # undirected graph: an edge given in one direction only is used in both
+    graph = graph.maximum(graph.T).tocsr()
+    return graph, labels
+
+
+class DistanceRows:
+    """
+    lazy matrix of the shortest path distances of a sparse graph, it can be used where the
+    algorithms expect a weight matrix: rows[u] (a row), rows[u, v], rows[np.ix_(r, c)], len(rows)
+    The rows are computed with Dijkstra when they are read and the last maxsize rows are cached.
+    """
+
+    def __init__(self, graph, maxsize=256):
+        """
+        param:
+            graph: symmetric sparse adjacency (see to_csr)
+            maxsize: number of rows (distances + predecessors) kept in memory
+        """
+        from scipy.sparse import csr_array
+
+        self.graph = csr_array(graph)
+        self.n = self.graph.shape[0]
+        self.maxsize = maxsize
+        self._rows = OrderedDict()
+        self.hits = 0
+        self.misses = 0 # rows computed
+
+    @property
+    def shape(self):
+        return (self.n, self.n)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float64)
+
+    @property
+    def batch(self):
+        """number of rows computed in one call of dijkstra"""
+        return int(max(1, min(self.maxsize, BATCH_BYTES // (12 * max(self.n, 1)))))
+
+    def _compute(self, sources):
+        from scipy.sparse.csgraph import dijkstra
+
+        for start in range(0, len(sources), self.batch):
+            block = sources[start:start + self.batch]
+            dist, pred = dijkstra(self.graph, directed=False, indices=block, return_predecessors=True)
+            for v, d, p in zip(block, dist, pred):
+                d.flags.writeable = False
+                self._store(v, (d, p.astype(np.int32)))
+
+    def _store(self, v, row):
+        self._rows[v] = row
+        self._rows.move_to_end(v)
+        if len(self._rows) > self.maxsize:
+            self._rows.popitem(last=False)
+
+    def _get(self, v):
+        v = int(v)
+        if v in self._rows:
+            self.hits += 1
+            self._rows.move_to_end(v)
+        else:
+            self.misses += 1
+            self._compute([v])
+        return self._rows[v]
+
+    def row(self, v):
+        """distances from v to every vertex (read only)"""
+        return self._get(v)[0]
+
+    def predecessors(self, v):
+        """predecessor of every vertex on a shortest path from v (-9999 for v and the unreachable vertices)"""
+        return self._get(v)[1]
+
+    def rows(self, vertices):
+        """2D array of the rows of vertices, the missing rows are computed by batches"""
+        position = {}
+        for i, v in enumerate(vertices):
+            position.setdefault(int(v), []).append(i)
+        out = np.empty((len(vertices), self.n))
+
+        missing = []
+        for v, where in position.items():
+            if v in self._rows:
+                self._rows.move_to_end(v)
+                out[where] = self._rows[v][0]
+            else:
+                missing.append(v)
+        self.hits += len(position) - len(missing)
+        self.misses += len(missing)
+
+        for start in range(0, len(missing), self.batch):
+            block = missing[start:start + self.batch]
+            self._compute(block)
+            for v in block:
+                out[position[v]] = self._rows[v][0]
+        return out
+
+    def path(self, source, dest):
+        """vertices of a shortest path from source to dest, without source, e.g A-B-C gives [B,C]"""
+        if source == dest:
+            return []
+        pred = self.predecessors(source)
+        if pred[dest] < 0:
+            raise ValueError(f"No path between {source} and {dest}")
+        path = [int(dest)]
+        while pred[path[-1]] != source:
+            path.append(int(pred[path[-1]]))
+        return path[::-1]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows, cols = key
+            if np.ndim(rows) == 0:
+                return self.row(rows)[cols]
+            # fancy indexing, e.g rows[np.ix_(r, c)] or rows[path[:-1], path[1:]]
+            rows, cols = np.broadcast_arrays(np.asarray(rows), np.asarray(cols))
+            unique, inverse = np.unique(rows, return_inverse=True)
+            return self.rows(unique)[inverse.reshape(rows.shape), cols]
+        return self.row(key)
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return f"DistanceRows(n={self.n}, edges={self.graph.nnz // 2}, cached={len(self._rows)}/{self.maxsize}, " \
+               f"hits={self.hits}, misses={self.misses})"
+
+
+def tree_odd_vertices(pred):
+    """vertices of odd degree of a tree given by its predecessor array (-1 for the root), in O(n)"""
+    has_parent = pred >= 0
+    degrees = has_parent.astype(int) + np.bincount(pred[has_parent], minlength=len(pred))
+    return np.flatnonzero(degrees % 2 == 1)
+
+
+def knn_matching_rows(rows, vertices, k=10):
+    """
+    matching of the vertices for the metric of rows (DistanceRows) like knn_matching,
+    without the dense submatrix of the vertices: blossom on the k nearest of each vertex,
+    the vertices left are matched greedily
+    return 2D array of the matched pairs (vertex indices)
+    """
+    vertices = np.asarray(vertices, dtype=int)
+    size = len(vertices)
+    if size == 0:
+        return np.empty((0, 2), dtype=int)
+    if size <= k + 1:
+        sub = rows[np.ix_(vertices, vertices)]
+        return blossom_matching(sub, labels=vertices)
+
+    src, dst, weights = [], [], []
+    for start in range(0, size, rows.batch):
+        block = np.arange(start, min(start + rows.batch, size))
+        dist = rows.rows(vertices[block])[:, vertices]
+        dist[np.arange(len(block)), block] = np.inf
+        nearest = np.argpartition(dist, k, axis=1)[:, :k]
+        src.append(np.repeat(block, k))
+        dst.append(nearest.ravel())
+        weights.append(np.take_along_axis(dist, nearest, axis=1).ravel())
+    src, dst, weights = np.concatenate(src), np.concatenate(dst), np.concatenate(weights)
+
+    lo, hi = np.minimum(src, dst), np.maximum(src, dst)
+    pairs, first = np.unique(np.column_stack([lo, hi]), axis=0, return_index=True)
+    res = blossom_matching(None, pairs[:, 0], pairs[:, 1], labels=np.arange(size), weights=weights[first])
+
+    matched = np.zeros(size, dtype=bool)
+    matched[res.ravel()] = True
+    if not matched.all():
+        left = np.flatnonzero(~matched)
+        rest = greedy_matching(rows[np.ix_(vertices[left], vertices[left])])
+        res = np.concatenate([res, left[rest].reshape(-1, 2)])
+
+    return vertices[res].reshape(-1, 2)
+
+
+def christofides_sparse(rows, start_vertex=0, k=10):
+    """
+    christofides tour of the metric closure of a connected sparse graph
+    param:
+        rows: DistanceRows of the graph
+        start_vertex: the vertex at which the tour starts and ends
+        k: number of candidate neighbours of the matching
+    return the tour over the closure e.g [0,4,2,1,3,0], see expand_path for the real edges
+    """
+    from scipy.sparse.csgraph import minimum_spanning_tree, breadth_first_order, connected_components
+
+    graph = rows.graph
+    n = rows.n
+    if n == 1:
+        return [start_vertex, start_vertex]
+    if connected_components(graph, directed=False)[0] != 1:
+        raise ValueError("The graph is not connected")
+
+    # a minimum spanning tree of the graph is also one of its metric closure
+    tree = minimum_spanning_tree(graph)
+    _, pred = breadth_first_order(tree, start_vertex, directed=False, return_predecessors=True)
+    pred = np.where(pred < 0, -1, pred)
+
+    odd_vertices = tree_odd_vertices(pred)
+    matching = knn_matching_rows(rows, odd_vertices, k=k)
+
+    offsets, targets = build_multigraph_csr(matching, pred, n)
+    tour = euler_tour_csr(offsets, targets, start_vertex=start_vertex)
+    return shortcut_tour(tour, n)
+
+
+def expand_path(rows, path):
+    """
+    the path with the real edges of the graph: every step u -> v of the closure is replaced
+    by a shortest path from u to v
+    """
+    path = [int(v) for v in path]
+    if -1 in path:
+        raise ValueError("The path contains -1 (no intermediate vertex found), it can not be expanded")
+    if not path:
+        return []
+    expanded = [path[0]]
+    for u, v in zip(path, path[1:]):
+        if u != v:
+            expanded.extend(rows.path(u, v))
+    return expanded
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from christofides import (ACPM, build_multigraph_csr, compute_impair_vertices, euler_tour, euler_tour_csr,
+                          minimum_weight_matching, remove_repeated_vertices_euleur, shortcut_tour,
+                          unite_matching_acpm)
+from utils import construct_alea_instance
+
+
+def random_multigraph(seed, matching):
+    """ACPM of a random instance and a matching of its odd vertices, from a random start vertex"""
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2, 60))
+    matrix, _ = construct_alea_instance(n, 0, rng=seed, as_matrix=True)
+    start = int(rng.integers(n))
+    tree = ACPM(matrix, s=start)
+    odd = compute_impair_vertices(tree)
+    if matching == "random":
+        # any pairing, the edges of the tree are often doubled
+        pairs = rng.permutation(odd).reshape(-1, 2)
+    else:
+        pairs = minimum_weight_matching(matrix, odd, method=matching)
+    return matrix, tree, pairs, start
+
+
+@pytest.mark.parametrize("matching", ["greedy", "random"])
+@pytest.mark.parametrize("seed", range(25))
+def test_euler_tour_csr_is_the_tour_of_the_adjacency_lists(seed, matching):
+    matrix, tree, pairs, start = random_multigraph(seed, matching)
+    n = len(matrix)
+
+    expected = euler_tour(unite_matching_acpm(pairs, tree, matrix), start_vertex=start)
+    offsets, targets = build_multigraph_csr(pairs, tree, n)
+    tour = euler_tour_csr(offsets, targets, start_vertex=start)
+
+    assert [int(v) for v in tour] == [int(v) for v in expected]
+    assert shortcut_tour(tour, n) == remove_repeated_vertices_euleur(expected)
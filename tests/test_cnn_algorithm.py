@@ -0,0 +1,41 @@
+import random
+
+import numpy as np
+import pytest
+
+from cnn_algorithm import apply_cnn, apply_cnn_to_routes
+from instance import Instance
+from utils import construct_alea_graph, construct_alea_instance
+
+
+def assert_valid_tour(path, n, start, blocked):
+    """closed walk from start over every vertex, without a blocked edge"""
+    assert path[0] == start and path[-1] == start
+    assert sorted(set(path)) == list(range(n))
+    for u, v in zip(path, path[1:]):
+        assert (min(u, v), max(u, v)) not in blocked
+
+
+def blocked_ids(routes, blockages):
+    ids = {label: i for i, label in enumerate(routes)}
+    return {(min(ids[a], ids[b]), max(ids[a], ids[b])) for a, b in blockages}
+
+
+def test_nearest_neighbor_selects_on_g_prime():
+    # choosing the next vertex on min(direct edge, G') took a direct edge to a vertex of U without
+    # a path of compress to the vertices left, CNN then raised "Aucun chemin a été trouvé ..."
+    routes, blockages = construct_alea_graph(15, 84, rng=random.Random(235))
+    path = apply_cnn_to_routes(routes, blockages)
+    assert_valid_tour(path, 15, 0, blocked_ids(routes, blockages))
+    assert path == [0, 9, 7, 1, 0, 5, 0, 12, 0, 9, 8, 10, 2, 3, 6, 0, 1, 4, 14, 11, 13, 11, 14, 4, 1, 0,
+                    6, 3, 2, 10, 8, 9, 0, 12, 0, 5, 0]
+
+
+@pytest.mark.parametrize("start_vertex", [0, 3])
+def test_cnn_starts_at_the_first_vertex_of_the_tour(start_vertex):
+    for seed in range(20):
+        matrix, pairs = construct_alea_instance(20, 30, rng=seed, as_matrix=True)
+        instance = Instance(matrix, pairs)
+        tour = instance.tour(start_vertex=start_vertex)
+        path = [int(v) for v in apply_cnn(matrix, instance.blockages, tour)]
+        assert_valid_tour(path, 20, start_vertex, {(min(a, b), max(a, b)) for a, b in np.asarray(pairs).tolist()})
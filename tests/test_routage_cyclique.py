@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from routage_cyclique import apply_routage_cyclique
+from utils import construct_alea_instance
+
+
+def run(engine, routes, blockages):
+    """the path of CR, or the message of its exception"""
+    try:
+        return list(apply_routage_cyclique(routes, blockages, engine=engine))
+    except Exception as e:
+        return str(e)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_ids_engine_matches_labels_engine(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(3, 40))
+    density = float(rng.choice([0.05, 0.2, 0.5, 0.8]))
+    routes, blockages = construct_alea_instance(n, int(density * n * (n - 1) / 2), rng=seed)
+
+    assert run("ids", routes, blockages) == run("labels", routes, blockages)
@@ -0,0 +1,120 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from christofides import apply_christophides
+
+
+class TourCache:
+    """
+    memoization of apply_christophides, the tour only depends on the distance matrix,
+    the start vertex and the options of christofides (not on the blockages) so CR and CNN
+    can share it on the same routes.
+    The key is a content hash of the matrix (dtype, shape and bytes), the tours are kept
+    in memory with a LRU eviction and optionally on disk (one .npy file per tour)
+    so that they survive between runs.
+    """
+
+    def __init__(self, maxsize=128, directory=None):
+        """
+        param:
+            maxsize: number of tours kept in memory
+            directory: optional directory of the on-disk store, created if needed
+        """
+        self.maxsize = maxsize
+        self.directory = directory
+        self._tours = OrderedDict()
+        self.hits = 0       # found in memory
+        self.disk_hits = 0  # found on disk
+        self.misses = 0     # computed
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(matrix, start_vertex=0, **options):
+        """content hash of the matrix, the start vertex and the options of christofides"""
+        matrix = np.ascontiguousarray(matrix)
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{matrix.dtype.str}|{matrix.shape}|{start_vertex}|{sorted(options.items())}".encode())
+        h.update(matrix)
+        return h.hexdigest()
+
+    def get(self, matrix, start_vertex=0, tracer=None, **options):
+        """
+        the christofides tour of the matrix, computed only if it is not already in the cache
+        param:
+            matrix: 2D numpy array of the weights
+            start_vertex: the vertex at which the tour starts and ends
+            tracer: optional instrumentation.Tracer, passed to apply_christophides when the tour is computed
+            options: matching and k of apply_christophides
+        return a new list every time, the caller can modify it
+        """
+        key = self.key(matrix, start_vertex, **options)
+
+        if key in self._tours:
+            self.hits += 1
+            if tracer is not None:
+                tracer.count("tour_cache_hits")
+            self._tours.move_to_end(key)
+            return list(self._tours[key])
+
+        tour = self._load(key)
+        if tour is not None:
+            self.disk_hits += 1
+            if tracer is not None:
+                tracer.count("tour_cache_hits")
+        else:
+            self.misses += 1
+            tour = apply_christophides(matrix, start_vertex=start_vertex, tracer=tracer, **options)
+            self._save(key, tour)
+
+        self._tours[key] = tuple(tour)
+        if len(self._tours) > self.maxsize:
+            self._tours.popitem(last=False)
+        return list(tour)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def _load(self, key):
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+        return np.load(self._path(key)).tolist()
+
+    def _save(self, key, tour):
+        if self.directory is None:
+            return
+        # write then rename so that another process never reads a partial file
+        tmp = f"{self._path(key)}.{os.getpid()}.tmp.npy"
+        np.save(tmp, np.asarray(tour, dtype=np.int64))
+        os.replace(tmp, self._path(key))
+
+    def clear(self):
+        """empty the memory part of the cache and reset the counters (the disk store is kept)"""
+        self._tours.clear()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def info(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "size": len(self._tours), "maxsize": self.maxsize, "directory": self.directory}
+
+    def __len__(self):
+        return len(self._tours)
+
+    def __repr__(self):
+        return (f"TourCache(hits={self.hits}, disk_hits={self.disk_hits}, misses={self.misses}, "
+                f"size={len(self._tours)}/{self.maxsize})")
+
+
+# cache used by CR and CNN, it can be replaced e.g tour_cache.DEFAULT_CACHE = TourCache(directory="tours")
+DEFAULT_CACHE = TourCache()
+
+
+def cached_christophides(matrix, start_vertex=0, cache=None, tracer=None, **options):
+    """apply_christophides through a TourCache (DEFAULT_CACHE by default)"""
+    if cache is None:
+        cache = DEFAULT_CACHE
+    return cache.get(matrix, start_vertex, tracer=tracer, **options)
@@ -1,33 +1,55 @@
 import numpy as np
 import random 
+from operator import itemgetter
+
+# dtype policy: the weight matrices are stored on 4 bytes (int32 or float32) when it is exact,
+# the sums of weights (costs, shortest paths) are computed on 8 bytes so that they can not overflow
+COMPACT_INT = np.int32
+COMPACT_FLOAT = np.float32
+# weight of a blocked edge in the float arrays of the algorithms (no large sentinel value to add to)
+BLOCKED = np.inf
+
+
+def compact_dtype(matrix):
+    """
+    the 4 bytes dtype that keeps every weight of matrix exactly: int32 for integers in its range,
+    float32 for floats equal to their float32 value, the dtype of matrix otherwise
+    """
+    matrix = np.asarray(matrix)
+    if matrix.dtype.kind in "iu":
+        info = np.iinfo(COMPACT_INT)
+        if matrix.size == 0 or (matrix.min() >= info.min and matrix.max() <= info.max):
+            return np.dtype(COMPACT_INT)
+    elif matrix.dtype.kind == "f":
+        if matrix.dtype.itemsize <= 4 or np.array_equal(matrix.astype(COMPACT_FLOAT), matrix, equal_nan=True):
+            return np.dtype(COMPACT_FLOAT)
+    return matrix.dtype
+
+
+def as_compact(matrix):
+    """the matrix stored with compact_dtype, not copied if it already has this dtype"""
+    matrix = np.asarray(matrix)
+    return matrix.astype(compact_dtype(matrix), copy=False)
+
+
+def sum_dtype(dtype):
+    """dtype of a sum of weights of dtype: int64 or float64"""
+    return np.dtype(np.float64) if np.dtype(dtype).kind == "f" else np.dtype(np.int64)
+
 
 def transform_to_matrix(tuple_graph):
-    """Transform a tuple to matrix form"""
-    matrix = [[0 for _ in range(len(tuple_graph))] for _ in range(len(tuple_graph))]
-    for i, node in enumerate(tuple_graph):
-        for j, neighbor in enumerate(tuple_graph):
-            matrix[i][j] = tuple_graph[node][neighbor]
-    return np.array(matrix)
-
-
-def create_symmetric_blockage(blockages):
-    """takes a blockages list and make it symmetric """
-    ret = blockages.copy()
-    for block in blockages:
-        s,d = block
-        ret.append([d,s])
-
-    return ret
-def get_blockages_in_int(blockages,base_tuple):
-    res = []
-    keys = list(base_tuple.keys())
-    k = {}
-    for i in range(len(keys)):k[keys[i]] = i
-    for i in range(len(blockages)):
-        sr,dest = blockages[i]
-        res.append([k[sr],k[dest]])
-        res.append([k[dest],k[sr]])
-    return res
+    """
+    Transform a tuple to matrix form, the rows and columns follow the order of the keys
+    the matrix is compact (int32 / float32) when the weights allow it, see as_compact
+    """
+    keys = list(tuple_graph)
+    if len(keys) == 0:
+        return np.array([])
+    if len(keys) == 1:
+        return as_compact(np.array([[tuple_graph[keys[0]][keys[0]]]]))
+    row = itemgetter(*keys) # one row of the matrix in a single call
+    return as_compact(np.array([row(tuple_graph[node]) for node in keys]))
+
 
 def get_path_in_letters(solution,base_tuple):
     """
@@ -45,12 +67,8 @@ def get_path_in_letters(solution,base_tuple):
     the returned results:
         ['A', 'D', 'E', 'C', 'B', 'A']
     """
-    res = []
     keys = list(base_tuple.keys())
-
-    for i in range(len(solution)):
-        res.append(keys[solution[i]])
-    return res
+    return [keys[i] for i in solution]
 
 
 
@@ -64,6 +82,12 @@ def calculate_cost(solution,base_tuple):
 
     return cost
 
+def calculate_cost_matrix(solution,matrix):
+    """calculate the cost of taking a path given in index with the weight matrix"""
+    solution = np.asarray(solution,dtype=int)
+    matrix = np.asarray(matrix)
+    return matrix[solution[:-1],solution[1:]].sum(dtype=sum_dtype(matrix.dtype)).item()
+
 def construct_example_path():
     vertices = [f"V{i+1}" for i in range(0,16)]
     
@@ -84,26 +108,33 @@ def construct_example_path():
 
 
 
-def construct_alea_graph(nb_vertices=None,nb_blockages=None):
+def construct_alea_graph(nb_vertices=None,nb_blockages=None,rng=None):
+    """
+    random complete metric graph (Floyd-Warshall closure of uniform weights in [1,100]) and random blockages
+    param:
+        nb_vertices: number of vertices, random between 50 and 100 by default
+        nb_blockages: number of blockages, 10*nb_vertices by default
+        rng: random.Random instance (e.g random.Random(seed)) to reproduce an instance,
+             the global random module is used by default
+    return the routes dict and the blockages list
+    """
+    if rng is None:
+        rng = random
 
     if nb_vertices is None:
-        nb_vertices = random.randint(50, 100)
+        nb_vertices = rng.randint(50, 100)
     if nb_blockages is None:
         nb_blockages = 10*nb_vertices
     graph = {}
     
-    cost_matrix = np.zeros((nb_vertices, nb_vertices), dtype=int)
+    cost_matrix = np.zeros((nb_vertices, nb_vertices), dtype=COMPACT_INT)
     
     for i in range(nb_vertices):
         for j in range(i + 1, nb_vertices):
-            cost_matrix[i][j] = random.randint(1, 100)
+            cost_matrix[i][j] = rng.randint(1, 100)
             cost_matrix[j][i] = cost_matrix[i][j] 
     
-    for k in range(nb_vertices):
-        for i in range(nb_vertices):
-            for j in range(nb_vertices):
-                if cost_matrix[i][j] > cost_matrix[i][k] + cost_matrix[k][j]:
-                    cost_matrix[i][j] = cost_matrix[i][k] + cost_matrix[k][j]
+    cost_matrix = metric_closure(cost_matrix)
     
     for i in range(nb_vertices):
         v = f"V{i}"
@@ -113,16 +144,131 @@ def construct_alea_graph(nb_vertices=None,nb_blockages=None):
         graph[v] = e
         
     blockages = []
-    nb_blockages = 10*nb_vertices
     for i in range(nb_blockages):
-        source = random.randint(0,nb_vertices-1)
+        source = rng.randint(0,nb_vertices-1)
 
-        dest = random.randint(0,nb_vertices-1)
+        dest = rng.randint(0,nb_vertices-1)
         if dest == source:
         
             while dest == source or [f"V{source}",f"V{dest}"] in blockages:
-                dest = random.randint(0,nb_vertices-1)
+                dest = rng.randint(0,nb_vertices-1)
         
         blockages.append([f"V{source}",f"V{dest}"])
 
-    return graph,blockages
\ No newline at end of file
+    return graph,blockages
+
+
+
+def metric_closure(matrix,method="threshold"):
+    """
+    shortest path distance between every pair of vertices of a complete weighted graph
+    param:
+        matrix: 2D symmetric array of the weights, positive outside of the diagonal
+        method: "threshold": dijkstra (scipy csgraph) on the edges of weight <= t only.
+                    A shortest path of length d only uses edges of weight <= d, so once the
+                    distances of the sparse graph are all <= t they are the exact ones.
+                    t starts at the smallest weight and is raised to the largest distance found
+                    (doubled while the sparse graph is not connected).
+                "floyd": vectorized Floyd-Warshall, one np.minimum per k, O(n^3)
+    return the distance matrix with the dtype of matrix
+    """
+    matrix = np.asarray(matrix)
+    n = len(matrix)
+
+    if method == "floyd":
+        D = matrix.copy()
+        for k in range(n):
+            # the sum is done on 8 bytes, the minimum is never larger than D so it fits back in its dtype
+            np.minimum(D, np.add(D[:, k, None], D[k, None, :], dtype=sum_dtype(D.dtype)), out=D, casting="unsafe")
+        return D
+    if method != "threshold":
+        raise ValueError(f"Unknown closure method: {method}")
+
+    if n < 2:
+        return matrix.copy()
+
+    # scipy is imported here, the other helpers of this file do not need it
+    from scipy.sparse import csr_array
+    from scipy.sparse.csgraph import shortest_path
+
+    upper = np.triu(np.ones((n, n), dtype=bool), 1)
+    t = matrix[upper].min()
+    kept = None
+    D = None
+    while True:
+        keep = upper & (matrix <= t)
+        if D is not None:
+            # an edge that is not shorter than the path already found can be dropped
+            keep &= kept | (matrix < D)
+        rows, cols = np.nonzero(keep)
+        graph = csr_array((matrix[rows, cols].astype(np.float64), (rows, cols)), shape=(n, n))
+        D = shortest_path(graph, method="D", directed=False)
+
+        top = D.max()
+        if top <= t:
+            break
+        kept = upper & (matrix <= t)
+        t = top if np.isfinite(top) else 2 * t
+
+    return D.astype(matrix.dtype)
+
+
+def sample_pairs(n,k,rng):
+    """
+    k distinct pairs (i,j) with i < j among the n*(n-1)/2 pairs of n vertices, without rejection:
+    k distinct indices of the upper triangle are drawn and converted to (row, column)
+    return a (k,2) int64 array
+    """
+    m = n * (n - 1) // 2
+    if k > m:
+        raise ValueError(f"Cannot draw {k} distinct pairs among {m}")
+    idx = rng.choice(m, size=k, replace=False).astype(np.int64)
+
+    # row i starts at index i*(2n-i-1)/2 of the upper triangle
+    i = np.floor(((2 * n - 1) - np.sqrt((2 * n - 1) ** 2 - 8 * idx.astype(np.float64))) / 2).astype(np.int64)
+    start = i * (2 * n - i - 1) // 2
+    i -= start > idx  # float rounding
+    start = i * (2 * n - i - 1) // 2
+    nxt = (i + 1) * (2 * n - i - 2) // 2
+    i += nxt <= idx
+    start = i * (2 * n - i - 1) // 2
+    j = idx - start + i + 1
+    return np.stack([i, j], axis=1)
+
+
+def construct_alea_instance(nb_vertices=None,nb_blockages=None,rng=None,weights=(1,100),as_matrix=False,closure="threshold"):
+    """
+    random instance like construct_alea_graph but built with numpy, usable for thousands of vertices
+    param:
+        nb_vertices: number of vertices, random between 50 and 100 by default
+        nb_blockages: number of distinct blocked edges, 10*nb_vertices by default (at most n*(n-1)/2)
+        rng: numpy Generator or a seed
+        weights: (low, high) the weights are uniform integers in [low, high] before the metric closure
+        as_matrix: if True return the distance matrix and the blocked pairs as vertex indices
+                   instead of the routes dict and the blockages with labels "V{i}"
+        closure: method of metric_closure
+    return (matrix, pairs) if as_matrix else (routes, blockages), the matrix is int32 when the weights allow it
+    """
+    rng = np.random.default_rng(rng)
+
+    if nb_vertices is None:
+        nb_vertices = int(rng.integers(50, 101))
+    if nb_blockages is None:
+        nb_blockages = 10*nb_vertices
+    n = nb_vertices
+
+    low, high = weights
+    cost_matrix = np.triu(rng.integers(low, high + 1, size=(n, n), dtype=np.int64), 1)
+    cost_matrix += cost_matrix.T
+    cost_matrix = as_compact(metric_closure(cost_matrix, method=closure))
+
+    pairs = sample_pairs(n, min(nb_blockages, n * (n - 1) // 2), rng)
+
+    if as_matrix:
+        return cost_matrix, pairs
+
+    labels = [f"V{i}" for i in range(n)]
+    rows = cost_matrix.tolist()
+    graph = {labels[i]: dict(zip(labels, rows[i])) for i in range(n)}
+    blockages = [[labels[a], labels[b]] for a, b in pairs.tolist()]
+    return graph, blockages